@@ -0,0 +1,13 @@
+### importing libraries
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")) # the conversion engine lives in ilikepdf/ at the repository root
+
+if __name__ == '__main__':
+    # gunicorn server processes, each loading and warming Spire up for both formats before it reports ready (--dev runs Flask's debug server instead)
+    from ilikepdf.serve import main
+    main(output_format = "docx,pptx", working_dir = "pdf-api/working")
+elif __name__ != "__mp_main__":
+    # spawned chunk workers re-import this script as __mp_main__ - they only need the engine, not an app of their own
+    from ilikepdf.api import create_app
+    # initializing Flask app converting to DOCX, PPTX or both (`formats=docx,pptx`) from one split of each PDF, for WSGI servers importing this file
+    app = create_app("docx,pptx", working_dir = "pdf-api/working")
@@ -0,0 +1,6 @@
+"""
+iLikePDF's conversion engine - PDF to DOCX/PPTX through Spire, split into chunks and converted in parallel.
+"""
+
+from .backends import available_backends, get_backend
+from .engine import ChunkConversionError, ConversionEngine
@@ -0,0 +1,168 @@
+"""
+fair-share admission for API requests - every conversion waits for one of a server process's slots, so a client sending
+many or huge PDFs can't crowd out everyone else. interactive requests go before batch ones, then the waiting request with
+the earliest virtual finish time - each client's requests queue behind that client's own earlier pages, so short requests
+and clients that sent little stay quick.
+"""
+
+import itertools
+import threading
+import time
+from . import metrics, settings
+
+priorities = ("interactive", "batch")
+
+class ClientQueueFull(Exception):
+    """Raised when a client already has `max_queued` requests waiting for a slot."""
+
+class QueueTimeout(Exception):
+    """Raised when a request waited longer than its timeout for a slot."""
+
+class Ticket:
+    """One request's place in a FairQueue - `with ticket:` waits for a slot and gives it back afterwards."""
+
+    def __init__(self, queue, client, priority, cost, start, timeout):
+        self.queue = queue
+        self.client = client
+        self.priority = priority
+        self.cost = cost
+        # virtual times this request's pages start and are done at, if every client got its fair share
+        self.start, self.finish = start, start + cost
+        self.timeout = timeout
+        self.seq = next(queue.seq)
+        self.arrived = time.time()
+        self.started = None
+        self.waited = None
+        self.active = None # the client's running conversions once this one started, itself included
+
+    def __enter__(self):
+        self.queue.wait(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.queue.release(self)
+
+    # response headers telling the client its class, its cap on running conversions and, once it has waited for its slot,
+    # how long that took and how many of its conversions were running then
+    def headers(self):
+        headers = {"X-Priority": self.priority}
+        if self.queue.client_max_active:
+            headers["X-Client-Limit"] = str(self.queue.client_max_active)
+        if self.waited is not None:
+            headers.update({"X-Queue-Wait": f"{self.waited:.3f}", "X-Client-Active": str(self.active)})
+        return headers
+
+class FairQueue:
+    """Hands out `slots` conversion slots - at most `batch_slots` to batch requests and `client_max_active` to any one client."""
+
+    def __init__(self, slots = settings.convert_slots, batch_slots = settings.job_workers, client_max_active = settings.client_max_active,
+                 client_max_queued = settings.client_max_queued, aging = settings.batch_aging_s):
+        self.slots = max(1, slots)
+        self.batch_slots = max(1, min(batch_slots, self.slots)) if batch_slots else self.slots
+        self.client_max_active = client_max_active
+        self.client_max_queued = client_max_queued
+        self.aging = aging
+        self.seq = itertools.count()
+        self.waiting = []
+        self.running = set()
+        self.clients = {} # client -> {"finish": virtual finish time of its last request, "active": n, "queued": n}
+        self.virtual_time = 0 # start time of the last request given a slot
+        self.condition = threading.Condition()
+        self.stats = {"admitted": 0, "rejected": 0, "timed_out": 0}
+
+    # queueing a request from `client` converting `cost` pages - returns its Ticket, or raises ClientQueueFull
+    # `timeout` is how long it may wait for a slot in seconds, None or 0 for as long as it takes
+    def request(self, client, priority = "interactive", cost = 1, timeout = None):
+        if priority not in priorities:
+            raise ValueError(f"unknown priority: {priority} (expected one of {', '.join(priorities)})")
+        with self.condition:
+            state = self.clients.setdefault(client, {"finish": 0, "active": 0, "queued": 0})
+            if self.client_max_queued and state["queued"] >= self.client_max_queued:
+                self.stats["rejected"] += 1
+                raise ClientQueueFull(f"{state['queued']} conversions from this client are already waiting, retry later")
+            # a client that sent nothing for a while starts at the current virtual time - idle time isn't banked as credit
+            ticket = Ticket(self, client, priority, max(1, cost), max(self.virtual_time, state["finish"]), timeout)
+            state["finish"] = ticket.finish
+            state["queued"] += 1
+            self.waiting.append(ticket)
+            self.dispatch()
+        return ticket
+
+    # blocking until `ticket` holds a slot, raising QueueTimeout past its timeout
+    def wait(self, ticket):
+        deadline = ticket.arrived + ticket.timeout if ticket.timeout else None
+        with self.condition:
+            while ticket.started is None and (deadline is None or time.time() < deadline):
+                self.condition.wait(deadline - time.time() if deadline else None)
+            if ticket.started is None:
+                self.cancel(ticket)
+                self.stats["timed_out"] += 1
+        if ticket.started is None:
+            self.record(ticket, time.time() - ticket.arrived, "error", error = "timed out")
+            raise QueueTimeout(f"no conversion slot came free within {ticket.timeout:g}s, retry later")
+        ticket.waited = ticket.started - ticket.arrived
+        self.record(ticket, ticket.waited, "ok")
+
+    # giving back a ticket's slot, or its place in the queue when it never got one
+    def release(self, ticket):
+        with self.condition:
+            if ticket in self.running:
+                self.running.discard(ticket)
+                self.clients[ticket.client]["active"] -= 1
+            elif ticket in self.waiting:
+                self.cancel(ticket)
+            self.forget(ticket.client)
+            if not self.running and not self.waiting: # idle - nobody is owed anything any more
+                self.clients.clear()
+            self.dispatch()
+
+    def cancel(self, ticket):
+        self.waiting.remove(ticket)
+        self.clients[ticket.client]["queued"] -= 1
+        self.forget(ticket.client)
+
+    # dropping a client with nothing waiting or running whose fair share has caught up, so the table doesn't grow forever
+    def forget(self, client):
+        state = self.clients.get(client)
+        if state and not state["active"] and not state["queued"] and state["finish"] <= self.virtual_time:
+            del self.clients[client]
+
+    # the order waiting tickets are given slots in - interactive (and batch that waited past `aging`) first, then earliest virtual finish
+    def rank(self, ticket, now):
+        aged = self.aging and now - ticket.arrived > self.aging
+        return (0 if ticket.priority == "interactive" or aged else 1, ticket.finish, ticket.seq)
+
+    # giving free slots to the best waiting tickets whose client and class are under their caps - called holding the condition
+    def dispatch(self):
+        now = time.time()
+        while len(self.running) < self.slots:
+            batch_running = sum(ticket.priority == "batch" for ticket in self.running)
+            eligible = [ticket for ticket in self.waiting
+                        if (not self.client_max_active or self.clients[ticket.client]["active"] < self.client_max_active)
+                        and (ticket.priority != "batch" or batch_running < self.batch_slots)]
+            if not eligible:
+                break
+            ticket = min(eligible, key = lambda ticket: self.rank(ticket, now))
+            self.waiting.remove(ticket)
+            self.running.add(ticket)
+            state = self.clients[ticket.client]
+            state["queued"] -= 1
+            state["active"] += 1
+            ticket.active = state["active"]
+            ticket.started = now
+            self.virtual_time = max(self.virtual_time, ticket.start)
+            self.stats["admitted"] += 1
+        self.condition.notify_all()
+
+    # the time a ticket waited for its slot, per priority in the histograms and per client in the JSON log
+    def record(self, ticket, seconds, status, **fields):
+        metrics.record("queue", client = ticket.client, priority = ticket.priority, cost = ticket.cost, seconds = round(seconds, 4), status = status, **fields)
+
+    # counters plus the slots in use and the requests waiting, per class
+    def summary(self):
+        with self.condition:
+            summary = dict(self.stats, slots = self.slots, batch_slots = self.batch_slots, client_max_active = self.client_max_active, clients = len(self.clients))
+            for priority in priorities:
+                summary[f"{priority}_running"] = sum(ticket.priority == priority for ticket in self.running)
+                summary[f"{priority}_waiting"] = sum(ticket.priority == priority for ticket in self.waiting)
+        return summary
@@ -0,0 +1,247 @@
+"""
+the Flask front end - one app per output format, or one app for several formats that converts a PDF to any of them
+at once, serving the conversion engine over HTTP.
+"""
+
+import hashlib
+import os
+import shutil
+import zipfile
+from flask import Flask, g, request, send_file, jsonify
+from . import metrics, settings
+from .admission import ClientQueueFull, FairQueue, QueueTimeout, priorities
+from .chunking import parse_pages
+from .engine import ChunkConversionError, MultiFormatEngine, no_progress
+from .jobs import JobQueue, QueueFull
+from .uploads import SpooledRequest, UploadRejected, receive
+from .workers import rss_mb
+from .workspaces import Workspaces, WorkspaceFull
+
+# packing converted files ({format: path or BytesIO}) into `{directory}/{pdf_name}.zip` as `{pdf_name}.{format}` each
+# - stored rather than deflated, DOCX and PPTX files are zip packages already
+def bundle(outputs, pdf_name, directory):
+    zip_path = os.path.join(directory, f"{pdf_name}.zip")
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as package:
+        for fmt, output in outputs.items():
+            if isinstance(output, str):
+                package.write(output, f"{pdf_name}.{fmt}")
+            else:
+                package.writestr(f"{pdf_name}.{fmt}", output.getvalue())
+    return zip_path
+
+# a converted file (a path or BytesIO) as a file in `workspace` - a BytesIO is written out as `result.{format}`, and a file
+# elsewhere, i.e. in the cache, linked (or copied) there so cache eviction can't remove it before it's downloaded
+def keep_in(workspace, output, requested):
+    if isinstance(output, str) and os.path.commonpath([os.path.abspath(output), os.path.abspath(workspace)]) == os.path.abspath(workspace):
+        return output
+    path = os.path.join(workspace, f"result.{requested[0]}")
+    if isinstance(output, str):
+        try:
+            os.link(output, path)
+        except OSError: # another filesystem, e.g. a workspace on tmpfs
+            shutil.copyfile(output, path)
+    else:
+        with open(path, "wb") as f:
+            f.write(output.getbuffer())
+    return path
+
+# building the Flask app converting PDFs to `output_format` - one format, or several as a list or separated by commas -
+# keeping its files in `working_dir`, converting splits on `workers` processes
+def create_app(output_format, working_dir, workers = None):
+    app = Flask(__name__)
+    formats = output_format.split(",") if isinstance(output_format, str) else list(output_format)
+    engine = MultiFormatEngine(formats, working_dir, workers = workers or settings.max_workers)
+
+    # converting a PDF (or only its `pages`) to `requested` formats in `workspace` - returns the one format's file, or a zip of every format's file
+    def convert_in(workspace, pdf_path, pdf_name, requested, pages = None, progress = no_progress):
+        outputs = engine.in_workspace(workspace).convert(pdf_path, pdf_name, requested, progress, pages = pages)
+        return outputs[requested[0]] if len(requested) == 1 else bundle(outputs, pdf_name, workspace)
+
+    # each job converts in its own workspace - the one its upload was spooled to - and keeps its result there as a file,
+    # so a finished job holds nothing in memory while it waits to be downloaded
+    def convert_job(pdf_path, pdf_name, progress, formats, pages = None):
+        workspace = os.path.dirname(pdf_path)
+        return keep_in(workspace, convert_in(workspace, pdf_path, pdf_name, formats, pages, progress), formats)
+
+    # every conversion, interactive or a job, waits for a slot in the fair queue - so every queued job gets a thread
+    # to wait on, and the fair queue rather than the order jobs came in decides which runs next
+    admission = FairQueue()
+    jobs = JobQueue(convert_job, workers = settings.max_queued_jobs)
+    workspaces = Workspaces(settings.workspace_dir or os.path.join(working_dir, "jobs"), on_sweep = jobs.expire).start()
+    app.config["ENGINE"], app.config["JOBS"], app.config["WORKSPACES"], app.config["ADMISSION"] = engine, jobs, workspaces, admission
+    # ready straight away unless a server warms the app up first (see serve.py)
+    app.config["READINESS"] = {"status": "ready"}
+
+    # uploads are streamed to disk as they arrive and refused early when they're too big
+    app.request_class = SpooledRequest
+    app.config["MAX_CONTENT_LENGTH"] = int(settings.max_upload_mb * 2**20) or None
+
+    # a workspace of its own for a request's upload and conversion, made before its body is read
+    def open_workspace():
+        g.workspace = workspaces.create(request.content_length or 0)
+        return g.workspace
+
+    # a request's workspace is removed once it's handled, unless its background job still needs it
+    @app.teardown_request
+    def release_workspace(exc):
+        if "workspace" in g and not g.get("workspace_kept"):
+            workspaces.release(g.workspace)
+
+    @app.errorhandler(WorkspaceFull)
+    def workspace_full(e):
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+
+    @app.errorhandler(UploadRejected)
+    def upload_rejected(e):
+        return jsonify({"error": str(e)}), e.status
+
+    @app.errorhandler(413)
+    def upload_too_large(e):
+        return jsonify({"error": f"the upload is larger than {settings.max_upload_mb:g} MB"}), 413
+
+    @app.errorhandler(ClientQueueFull)
+    def client_queue_full(e):
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "10", "X-Client-Limit": str(admission.client_max_active)}
+
+    @app.errorhandler(QueueTimeout)
+    def queue_timeout(e):
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+
+    # who a request comes from, for fair sharing - its X-API-Key (hashed, so keys never reach the logs), the client header,
+    # or its address
+    def requesting_client():
+        api_key = request.headers.get("X-API-Key")
+        if api_key:
+            return "key-" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+        return request.headers.get(settings.client_header) or request.remote_addr or "unknown"
+
+    # the priority class a request asks for, as an X-Priority header or `priority=batch` in its query or form - `default` otherwise
+    def requested_priority(default):
+        priority = (request.headers.get("X-Priority") or request.values.get("priority") or default).strip().lower()
+        if priority not in priorities:
+            raise UploadRejected(f"unknown priority: {priority} (expected one of {', '.join(priorities)})", 400)
+        return priority
+
+    # a request's place in the fair queue - its cost is the pages it converts, once per requested format
+    def queue_ticket(default_priority, page_count, requested, pages, timeout = None):
+        selected = len(parse_pages(pages, page_count)) if pages else page_count
+        return admission.request(requesting_client(), requested_priority(default_priority), selected * len(requested), timeout)
+
+    # the formats a request asks for, as `formats=docx,pptx` in its query or form - every format of the app by default
+    def requested_formats():
+        requested = [fmt.strip() for fmt in request.values.get("formats", "").split(",") if fmt.strip()] or formats
+        unsupported = [fmt for fmt in requested if fmt not in formats]
+        if unsupported:
+            raise UploadRejected(f"unsupported format: {', '.join(unsupported)} (expected one of {', '.join(formats)})", 400)
+        return list(dict.fromkeys(requested))
+
+    # the pages a request asks for, as `pages=1-5,8,10-` in its query or form - checked against the PDF's `page_count`,
+    # None for every page
+    def requested_pages(page_count):
+        pages = request.values.get("pages", "").strip()
+        try:
+            return pages if pages and parse_pages(pages, page_count) else None
+        except ValueError as e:
+            raise UploadRejected(str(e), 400)
+
+    # sending a converted file, or the zip of several - a path is opened straight away, so the file stays readable while it's
+    # sent even once its workspace is removed (where the OS can't remove an open file, the janitor removes the workspace later)
+    def send_output(output, pdf_name, requested):
+        if isinstance(output, str):
+            output = open(output, "rb")
+        return send_file(output, as_attachment = True, download_name = f"{pdf_name}.{requested[0] if len(requested) == 1 else 'zip'}")
+
+    # Flask route to handle PDF conversion
+    @app.route('/convert-pdf', methods = ['POST'])
+    def convert_pdf_api():
+        # get the uploaded PDF file from request, spooled to the request's workspace and checked against the limits
+        workspace = open_workspace()
+        pdf_path, pdf_name, page_count = receive(request)
+        requested, pages = requested_formats(), requested_pages(page_count)
+        ticket = queue_ticket("interactive", page_count, requested, pages, settings.max_queue_wait_s)
+        try:
+            # wait for a conversion slot, then process the PDF file (or the requested pages) and return the final converted file,
+            # or a zip holding one per requested format
+            with ticket:
+                output = convert_in(workspace, pdf_path, pdf_name, requested, pages)
+            response = send_output(output, pdf_name, requested)
+            response.headers.update(ticket.headers())
+            return response
+
+        except QueueTimeout:
+            raise
+        except ChunkConversionError as e:
+            return jsonify({"error": str(e), "failed_chunks": e.failures}), 500, ticket.headers()
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500, ticket.headers()
+
+    # Flask route to submit a PDF for background conversion
+    @app.route('/jobs', methods = ['POST'])
+    def submit_job():
+        workspace = open_workspace()
+        pdf_path, pdf_name, page_count = receive(request)
+        requested, pages = requested_formats(), requested_pages(page_count)
+        # jobs are batch work unless they ask otherwise, and wait for their slot without a timeout
+        ticket = queue_ticket("batch", page_count, requested, pages)
+        try:
+            # the workspace outlives the request - it holds the job's result until the job expires or is dropped
+            job_id = jobs.submit(pdf_path, pdf_name, cleanup = lambda: os.remove(pdf_path), release = lambda: workspaces.release(workspace), ticket = ticket, formats = requested, pages = pages)
+        except QueueFull as e:
+            admission.release(ticket)
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+        g.workspace_kept = True
+        return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}", "result_url": f"/jobs/{job_id}/result"}), 202, {"X-Priority": ticket.priority}
+
+    # Flask route to check on a job
+    @app.route('/jobs/<job_id>', methods = ['GET'])
+    def get_job(job_id):
+        status = jobs.status(job_id)
+        if status is None:
+            return jsonify({"error": "unknown job"}), 404
+        return jsonify(status)
+
+    # Flask route to download a finished job's file
+    @app.route('/jobs/<job_id>/result', methods = ['GET'])
+    def get_job_result(job_id):
+        status = jobs.status(job_id)
+        if status is None:
+            return jsonify({"error": "unknown job"}), 404
+        if status["status"] == "failed":
+            return jsonify(status), 500
+        if status["status"] != "done":
+            return jsonify(status), 409
+        result = jobs.result(job_id)
+        if result is None: # dropped since its status was read
+            return jsonify({"error": "unknown job"}), 404
+        response = send_output(result, status['pdf_name'], status["options"]["formats"])
+        if "queue_wait_s" in status:
+            response.headers.update({"X-Queue-Wait": f"{status['queue_wait_s']:.3f}", "X-Priority": status["priority"]})
+        return response
+
+    # Flask route for readiness probes - 503 while this process warms up, then its cold start and memory
+    @app.route('/ready', methods = ['GET'])
+    def get_ready():
+        readiness = app.config["READINESS"]
+        return jsonify({**readiness, "pid": os.getpid(), "rss_mb": round(rss_mb())}), 200 if readiness["status"] == "ready" else 503
+
+    # Flask route reporting the caches' counters
+    @app.route('/cache/stats', methods = ['GET'])
+    def get_cache_stats():
+        return jsonify(engine.cache_summary())
+
+    # Flask route reporting the live workspaces and the janitor's counters
+    @app.route('/workspaces/stats', methods = ['GET'])
+    def get_workspace_stats():
+        return jsonify(workspaces.summary())
+
+    # Flask route reporting the fair queue's slots in use, requests waiting per priority and counters
+    @app.route('/queue/stats', methods = ['GET'])
+    def get_queue_stats():
+        return jsonify(admission.summary())
+
+    # Flask route exposing per-stage histograms and counters in the Prometheus text format
+    @app.route('/metrics', methods = ['GET'])
+    def get_metrics():
+        return metrics.registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    return app
@@ -0,0 +1,29 @@
+"""
+output backends - each one converts split PDFs to its format, merges the splits and removes Spire's watermarks.
+a backend is imported on first use, so a DOCX-only process never loads Spire.Presentation and vice versa.
+"""
+
+import importlib
+from contextlib import contextmanager
+
+# format name -> (module, class) of its backend
+available_backends = {
+    "docx": ("ilikepdf.backends.docx_backend", "DocxBackend"),
+    "pptx": ("ilikepdf.backends.pptx_backend", "PptxBackend"),
+}
+
+# returning the backend for a format name such as "docx"
+def get_backend(name):
+    if name not in available_backends:
+        raise ValueError(f"unsupported output format: {name} (expected one of {', '.join(available_backends)})")
+    module, cls = available_backends[name]
+    return getattr(importlib.import_module(module), cls)()
+
+# releasing a Spire object's native memory when the block exits, however it exits - Spire objects are closed or disposed,
+# never left to Python's garbage collector, which doesn't see their native memory
+@contextmanager
+def released(spire_object):
+    try:
+        yield spire_object
+    finally:
+        (getattr(spire_object, "Close", None) or spire_object.Dispose)()
@@ -0,0 +1,210 @@
+"""
+DOCX backend - Spire.PDF converts (or pdf2docx, for splits of plain text), Spire.Doc merges and python-docx removes the evaluation warnings.
+"""
+
+import importlib.machinery
+import importlib.util
+import logging
+import os
+import re
+import sys
+from io import BytesIO
+from docx import Document as docx_document
+from spire.pdf import PdfDocument
+from spire.pdf import FileFormat as PdfFileFormat
+from spire.pdf.common import Stream as PdfStream
+from spire.doc import Document, FileFormat
+from spire.doc.common import Stream as DocStream
+from .. import settings
+from ..chunking import plain_text, probe_pages
+from ..ooxml import DocxPackageMerger
+from . import released
+
+# finding the pdf2docx package without importing it - while the bulk script pipelines-for-bulk-conversion/pdf2docx.py
+# runs, its directory is first on sys.path (in the spawned workers too) and `import pdf2docx` would find the script,
+# so when a lone module shadows the package it's looked for again on sys.path without that module's directory
+def find_pdf2docx():
+    spec = importlib.machinery.PathFinder.find_spec("pdf2docx", sys.path)
+    if spec is not None and spec.submodule_search_locations is None:
+        shadowing = os.path.dirname(os.path.abspath(spec.origin))
+        spec = importlib.machinery.PathFinder.find_spec("pdf2docx", [path for path in sys.path if os.path.abspath(path or os.curdir) != shadowing])
+    return spec
+
+_pdf2docx_installed = None
+
+def pdf2docx_installed():
+    global _pdf2docx_installed
+    if _pdf2docx_installed is None:
+        _pdf2docx_installed = find_pdf2docx() is not None
+    return _pdf2docx_installed
+
+# importing pdf2docx on first use, in the worker converting with it - it loads OpenCV and NumPy, which Spire-only processes don't need
+def import_pdf2docx():
+    module = sys.modules.get("pdf2docx")
+    if module is not None and hasattr(module, "__path__"):
+        return module
+    spec = find_pdf2docx()
+    if spec is None:
+        raise ImportError("converting with pdf2docx needs the pdf2docx package (pip install pdf2docx)")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["pdf2docx"] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules["pdf2docx"]
+        raise
+    # pdf2docx sets the root logger to INFO and logs every page it parses
+    logging.getLogger().setLevel(logging.WARNING)
+    return module
+
+class DocxMerger:
+    """Builds one Spire document out of converted splits (paths or bytes), appended in page order as they become ready."""
+
+    def __init__(self):
+        self.doc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.doc is not None:
+            self.doc.Close()
+            self.doc = None
+
+    # the first split is loaded as the document, the content of every later one is inserted after it
+    def append(self, split):
+        first = self.doc is None
+        if first:
+            self.doc = Document()
+        if isinstance(split, str):
+            self.doc.LoadFromFile(split) if first else self.doc.InsertTextFromFile(split, FileFormat.Auto)
+        else:
+            with released(DocStream(split)) as split_stream:
+                self.doc.LoadFromStream(split_stream, FileFormat.Docx) if first else self.doc.InsertTextFromStream(split_stream, FileFormat.Docx)
+
+    # saving the merged document to `output_path`, or returning its bytes without one
+    def save(self, output_path = None):
+        if output_path:
+            self.doc.SaveToFile(output_path)
+            return output_path
+        with released(DocStream()) as stream:
+            self.doc.SaveToStream(stream, FileFormat.Docx)
+            return stream.ToArray()
+
+class DocxBackend:
+    name = "docx"
+    ext = "docx"
+    label = "DOCX"
+
+    # picking the converter for one split (a path or its bytes) from its pages' probes - pdf2docx for plain text, Spire
+    # for everything else - unless DOCX_CONVERTER forces one
+    def route(self, split):
+        if settings.docx_converter != "auto":
+            return "pdf2docx" if settings.docx_converter == "pdf2docx" else "spire"
+        return "pdf2docx" if pdf2docx_installed() and plain_text(probe_pages(split)) else "spire"
+
+    # the converters splits may be routed to under the current settings
+    def converters(self):
+        if settings.docx_converter != "auto":
+            return ["pdf2docx" if settings.docx_converter == "pdf2docx" else "spire"]
+        return ["spire", "pdf2docx"] if pdf2docx_installed() else ["spire"]
+
+    # converting one split PDF to DOCX with `converter` - runs inside a worker process, each worker with its own Spire instance
+    def convert_chunk(self, split_pdf_path, docx_path, converter = "spire"):
+        if converter == "pdf2docx":
+            return self.convert_with_pdf2docx(split_pdf_path, docx_path)
+        with released(PdfDocument()) as pdf:
+            pdf.LoadFromFile(split_pdf_path)
+            pdf.SaveToFile(docx_path, PdfFileFormat.DOCX)
+        return docx_path
+
+    # converting one split PDF's bytes to DOCX bytes with `converter`
+    def convert_chunk_stream(self, split_pdf_bytes, converter = "spire"):
+        if converter == "pdf2docx":
+            return self.convert_with_pdf2docx(split_pdf_bytes, BytesIO()).getvalue()
+        with released(PdfStream(split_pdf_bytes)) as source_stream, released(PdfDocument(source_stream)) as pdf, released(PdfStream()) as stream:
+            pdf.SaveToStream(stream, PdfFileFormat.DOCX)
+            return stream.ToArray()
+
+    # converting one split (a path or its bytes) with pdf2docx, to `output` - a path or a file-like object
+    # the worker is already one of many, so pdf2docx parses the pages in this process rather than starting its own
+    def convert_with_pdf2docx(self, split, output):
+        Converter = import_pdf2docx().Converter
+        converter = Converter(split) if isinstance(split, str) else Converter(stream = split)
+        try:
+            converter.convert(output, multi_processing = False)
+        finally:
+            converter.close()
+        return output
+
+    # an incremental merger - `with backend.merger() as merger`, then `merger.append(split)` in page order and `merger.save()`
+    def merger(self):
+        return DocxPackageMerger() if settings.merge_backend == "ooxml" else DocxMerger()
+
+    # merging split DOCXs, in the given order, into one DOCX (still carrying Spire watermarks)
+    def merge(self, split_docx_paths, output_path):
+        with self.merger() as merger:
+            for split_docx_path in split_docx_paths:
+                merger.append(split_docx_path)
+            return merger.save(output_path)
+
+    # merging split DOCXs' bytes, in the given order, into one DOCX's bytes
+    def merge_stream(self, split_docxs):
+        with self.merger() as merger:
+            for split_docx in split_docxs:
+                merger.append(split_docx)
+            return merger.save()
+
+    # removing Spire watermarks - `source` and `output` are paths or file-like objects
+    def remove_watermarks(self, source, output):
+        # defining regex patterns for the two evaluation warnings
+        eval1 = re.compile("Evaluation Warning : The document was created with Spire.PDF for Python.")
+        eval2 = re.compile("Evaluation Warning: The document was created with Spire.Doc for Python.")
+
+        def paragraph_replace_text(paragraph, regex, replace_str):
+            """
+            Return `paragraph` after replacing all matches for `regex` with `replace_str`.
+            """
+            # a paragraph may contain more than one match, loop until all are replaced
+            while True:
+                text = paragraph.text
+                match = regex.search(text)
+                if not match:
+                    break
+
+                # when there's a match, we need to modify run.text for each run that contains any part of the match-string.
+                runs = iter(paragraph.runs)
+                start, end = match.start(), match.end()
+
+                # skip over any leading runs that do not contain the match
+                for run in runs:
+                    run_len = len(run.text)
+                    if start < run_len:
+                        break
+                    start, end = start - run_len, end - run_len
+
+                # match starts somewhere in the current run. replace match-str prefix occurring in this run with entire replacement str.
+                run_text = run.text
+                run_len = len(run_text)
+                run.text = "%s%s%s" % (run_text[:start], replace_str, run_text[end:])
+                end -= run_len  # note this is run-len before replacement
+
+                # remove any suffix of match word that occurs in following runs. note that such a suffix will always begin at the first character of the run. also note a suffix can span one or more entire following runs.
+                for run in runs:  # next and remaining runs, uses same iterator
+                    if end <= 0:
+                        break
+                    run_text = run.text
+                    run_len = len(run_text)
+                    run.text = run_text[end:]
+                    end -= run_len
+
+            return paragraph
+
+        document = docx_document(source)
+        for paragraph in document.paragraphs:
+            paragraph_replace_text(paragraph, eval1, "")
+            paragraph_replace_text(paragraph, eval2, "")
+
+        # saving the document with the evaluation warnings removed
+        document.save(output)
+        return output
@@ -0,0 +1,141 @@
+"""
+PPTX backend - Spire.PDF converts, Spire.Presentation merges and python-pptx removes the evaluation warnings.
+"""
+
+import re
+from pptx import Presentation as pptx_pres
+from spire.pdf import PdfDocument
+from spire.pdf import FileFormat as PdfFileFormat
+from spire.pdf.common import Stream as PdfStream
+from spire.presentation import Presentation, FileFormat
+from spire.presentation.common import Stream as PresStream
+from .. import settings
+from ..ooxml import PptxPackageMerger
+from . import released
+
+class PptxMerger:
+    """Builds one Spire presentation out of converted splits (paths or bytes), appended in page order as they become ready."""
+
+    def __init__(self):
+        self.target_pres = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.target_pres is not None:
+            self.target_pres.Dispose()
+            self.target_pres = None
+
+    # loading one split into `pres`
+    def load(self, pres, split):
+        if isinstance(split, str):
+            pres.LoadFromFile(split)
+        else:
+            with released(PresStream(split)) as split_stream:
+                pres.LoadFromStream(split_stream, FileFormat.Pptx2016)
+
+    # the first split is loaded as the presentation, every slide of each later one is appended to it
+    def append(self, split):
+        if self.target_pres is None:
+            self.target_pres = Presentation()
+            return self.load(self.target_pres, split)
+        with released(Presentation()) as pres:
+            self.load(pres, split)
+            for slide in pres.Slides:
+                self.target_pres.Slides.AppendBySlide(slide)
+
+    # saving the merged presentation to `output_path`, or returning its bytes without one
+    def save(self, output_path = None):
+        if output_path:
+            self.target_pres.SaveToFile(output_path, FileFormat.Pptx2016)
+            return output_path
+        with released(PresStream()) as stream:
+            self.target_pres.SaveToFile(stream, FileFormat.Pptx2016)
+            return stream.ToArray()
+
+class PptxBackend:
+    name = "pptx"
+    ext = "pptx"
+    label = "PPTX"
+
+    # every split converts with Spire - there's no other PPTX converter to route to
+    def route(self, split):
+        return "spire"
+
+    def converters(self):
+        return ["spire"]
+
+    # converting one split PDF to PPTX - runs inside a worker process, each worker with its own Spire instance
+    def convert_chunk(self, split_pdf_path, pptx_path, converter = "spire"):
+        print(f"Converting {split_pdf_path} to PPTX...")
+        with released(PdfDocument()) as pdf:
+            pdf.LoadFromFile(split_pdf_path)
+            pdf.SaveToFile(pptx_path, PdfFileFormat.PPTX)
+        print(f"Closed {split_pdf_path}")
+        return pptx_path
+
+    # converting one split PDF's bytes to PPTX bytes
+    def convert_chunk_stream(self, split_pdf_bytes, converter = "spire"):
+        with released(PdfStream(split_pdf_bytes)) as source_stream, released(PdfDocument(source_stream)) as pdf, released(PdfStream()) as stream:
+            pdf.SaveToStream(stream, PdfFileFormat.PPTX)
+            return stream.ToArray()
+
+    # an incremental merger - `with backend.merger() as merger`, then `merger.append(split)` in page order and `merger.save()`
+    def merger(self):
+        return PptxPackageMerger() if settings.merge_backend == "ooxml" else PptxMerger()
+
+    # merging split PPTXs, in the given order, into one PPTX (still carrying Spire watermarks)
+    def merge(self, split_pptx_paths, output_path):
+        with self.merger() as merger:
+            for split_pptx_path in split_pptx_paths:
+                merger.append(split_pptx_path)
+            return merger.save(output_path)
+
+    # merging split PPTXs' bytes, in the given order, into one PPTX's bytes
+    def merge_stream(self, split_pptxs):
+        with self.merger() as merger:
+            for split_pptx in split_pptxs:
+                merger.append(split_pptx)
+            return merger.save()
+
+    # removing Spire watermarks - `source` and `output` are paths or file-like objects
+    def remove_watermarks(self, source, output):
+        # defining regex patterns for the two evaluation warnings
+        eval1 = re.compile("Evaluation Warning : The document was created with Spire.PDF for Python.")
+        eval2 = re.compile("Evaluation Warning : The document was created with Spire.Presentation for Python")
+
+        def remove_shapes_with_regex(slide, regex):
+            """Remove shapes in the slide where the regex pattern is found in the text."""
+            shapes_to_remove = []
+
+            for shape in slide.shapes:
+                if shape.has_text_frame:
+                    text_frame = shape.text_frame
+                    # check if any paragraph in the shape contains the pattern
+                    for paragraph in text_frame.paragraphs:
+                        for run in paragraph.runs:
+                            if regex.search(run.text):
+                                shapes_to_remove.append(shape)
+                                break
+                        else:
+                            continue
+                        break
+
+            # remove the shapes that contain the regex pattern
+            for shape in shapes_to_remove:
+                slide.shapes._spTree.remove(shape._element)
+
+        def presentation_remove_shapes(presentation, regex):
+            """Remove shapes containing the regex pattern in all slides of the presentation."""
+            for slide in presentation.slides:
+                remove_shapes_with_regex(slide, regex)
+            return presentation
+
+        pres = pptx_pres(source)
+
+        presentation_remove_shapes(pres, eval1)
+        presentation_remove_shapes(pres, eval2)
+
+        pres.save(output)
+        return output
@@ -0,0 +1,256 @@
+"""
+the benchmark harness - generates a reproducible corpus of synthetic PDFs (text, image and table pages, from 1 to 1000
+pages), converts it to DOCX and PPTX under each chunk size and worker count, and reports pages/s, p50/p95 latency and
+peak memory. results are written as JSON and compared against a stored baseline.
+
+usage: python -m ilikepdf.benchmark --formats docx pptx --chunk-pages 0 10 --workers 1 4 --sizes 1 10 100
+       python -m ilikepdf.benchmark --sizes 1 10 --baseline benchmarks/baseline.json
+       python -m ilikepdf.benchmark --sizes 1 10 --no-fast-path --output benchmarks/no-fast-path.json
+       python -m ilikepdf.benchmark --sizes 100 --split-backend pymupdf --baseline benchmarks/spire-split.json
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import fitz # PyMuPDF
+from PIL import Image, ImageDraw
+
+kinds = ("text", "image", "table")
+sizes = (1, 10, 100, 1000)
+words = ("pdf", "page", "split", "merge", "convert", "document", "slide", "table", "image", "chunk", "worker", "spire",
+         "format", "layout", "paragraph", "section", "memory", "latency", "throughput", "report", "quarterly", "revenue")
+
+### the corpus
+# a paragraph of `count` random words
+def sentence(rng, count):
+    return " ".join(rng.choice(words) for _ in range(count)).capitalize() + "."
+
+# a text page - a heading and paragraphs of running text
+def text_page(doc, rng):
+    page = doc.new_page()
+    page.insert_text((72, 72), sentence(rng, 5), fontsize = 18)
+    page.insert_textbox(fitz.Rect(72, 100, page.rect.width - 72, page.rect.height - 72), "\n\n".join(sentence(rng, rng.randint(40, 80)) for _ in range(5)), fontsize = 10)
+
+# an image page - a caption and two pictures of random shapes, JPEG-encoded like scans and photos usually are
+def image_page(doc, rng):
+    page = doc.new_page()
+    page.insert_text((72, 72), sentence(rng, 6), fontsize = 12)
+    for top in (90, 440):
+        picture = Image.new("RGB", (900, 600), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(picture)
+        for _ in range(40):
+            x, y = rng.randrange(900), rng.randrange(600)
+            shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+            shape((x, y, x + rng.randrange(20, 300), y + rng.randrange(20, 200)), fill = tuple(rng.randrange(256) for _ in range(3)))
+        data = io.BytesIO()
+        picture.save(data, "JPEG", quality = 85)
+        page.insert_image(fitz.Rect(72, top, page.rect.width - 72, top + 320), stream = data.getvalue())
+
+# a table page - a ruled grid of figures with a header row
+def table_page(doc, rng, rows = 24, columns = 6):
+    page = doc.new_page()
+    page.insert_text((72, 60), sentence(rng, 4), fontsize = 14)
+    left, top, width, height = 72, 80, (page.rect.width - 144) / columns, 26
+    shape = page.new_shape() # one content stream for the whole table, not one per cell
+    for row in range(rows + 1):
+        for column in range(columns):
+            cell = fitz.Rect(left + column * width, top + row * height, left + (column + 1) * width, top + (row + 1) * height)
+            shape.draw_rect(cell)
+            shape.finish(color = (0, 0, 0), fill = (0.85, 0.85, 0.85) if row == 0 else None, width = 0.5)
+            text = rng.choice(words).title() if row == 0 else f"{rng.uniform(0, 100000):,.2f}"
+            shape.insert_text((cell.x0 + 4, cell.y1 - 8), text, fontsize = 9)
+    shape.commit()
+
+page_makers = {"text": text_page, "image": image_page, "table": table_page}
+
+# writing `{kind}-{pages}.pdf` for every kind and size into `corpus_dir` - the same seed always gives the same pages,
+# and files already there are reused
+def generate_corpus(corpus_dir, corpus_kinds = kinds, corpus_sizes = sizes, seed = 0):
+    os.makedirs(corpus_dir, exist_ok = True)
+    paths = []
+    for kind in corpus_kinds:
+        for pages in corpus_sizes:
+            path = f"{corpus_dir}/{kind}-{pages}.pdf"
+            if not os.path.exists(path):
+                print(f"Generating ({kind}-{pages}.pdf)...")
+                rng = random.Random(f"{seed}-{kind}-{pages}")
+                with fitz.open() as doc:
+                    for _ in range(pages):
+                        page_makers[kind](doc, rng)
+                    doc.set_metadata({}) # no creation dates (and no random file id below), so regenerating gives identical files
+                    doc.save(path, garbage = 3, deflate = True, no_new_id = True)
+            paths.append(path)
+    return paths
+
+# name, kind, pages, size and hash of a corpus file, so results are only compared between identical corpora
+def describe(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    with fitz.open(stream = data, filetype = "pdf") as doc:
+        pages = doc.page_count
+    name = os.path.basename(path).rsplit(".", 1)[0]
+    return {"document": name, "kind": name.split("-")[0], "pages": pages, "bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+### one case - a format, chunk size and worker count - runs in its own process, since settings are read at import
+# and the worker pool is created once per process
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def run_case(case_path):
+    from . import engine, metrics
+    from .workers import peak_rss_mb
+
+    with open(case_path) as f:
+        case = json.load(f)
+    work_dir = tempfile.mkdtemp(prefix = "ilikepdf-bench-")
+    try:
+        # a fresh engine and cache for every conversion - repeats would otherwise be served from the cache
+        def convert(pdf_path, run):
+            conversion_engine = engine.ConversionEngine(case["format"], f"{work_dir}/working", f"{work_dir}/cache")
+            started = time.perf_counter()
+            conversion_engine.convert(pdf_path, run)
+            seconds = time.perf_counter() - started
+            for directory in ("working", "cache"):
+                shutil.rmtree(f"{work_dir}/{directory}", ignore_errors = True)
+            return seconds
+
+        # the first conversion pays for loading Spire and starting the workers, which isn't what's being measured
+        for warmup in range(case["warmup"]):
+            convert(min(case["documents"], key = os.path.getsize), f"warmup-{warmup}")
+
+        results = []
+        for pdf_path in case["documents"]:
+            name = os.path.basename(pdf_path).rsplit(".", 1)[0]
+            metrics.registry = metrics.Registry() # each document's own stage breakdown
+            seconds = [convert(pdf_path, f"{name}-{run}") for run in range(case["repeat"])]
+            stages = {metrics.stage_label(key): round(entry["histograms"]["seconds"].sum / case["repeat"], 4) for key, entry in metrics.registry.stages.items()}
+            results.append({"document": name, "seconds": [round(s, 4) for s in seconds], "stages": stages})
+
+        # memory is a high-water mark, so it's reported for the whole case rather than per document
+        pool = engine._pool
+        output = {"results": results, "peak_rss_mb": round(peak_rss_mb()), "worker_peak_rss_mb": pool.stats["peak_rss_mb"] if pool else None}
+        if pool:
+            pool.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors = True)
+    with open(case_path, "w") as f:
+        json.dump(output, f)
+
+# running one case in a fresh interpreter with its settings in the environment
+def measure(output_format, chunk_pages, workers, documents, repeat, warmup, fast_path = True, split_backend = "spire", docx_converter = "auto"):
+    with tempfile.NamedTemporaryFile("w", suffix = ".json", delete = False) as f:
+        json.dump({"format": output_format, "documents": documents, "repeat": repeat, "warmup": warmup}, f)
+    env = {**os.environ, "CONVERT_WORKERS": str(workers), "CHUNK_PAGES": str(chunk_pages), "FAST_PATH": "1" if fast_path else "0",
+           "SPLIT_BACKEND": split_backend, "DOCX_CONVERTER": docx_converter, "METRICS_LOG": "off"}
+    try:
+        subprocess.run([sys.executable, "-m", "ilikepdf.benchmark", "--run-case", f.name], env = env, check = True, stdout = subprocess.DEVNULL)
+        with open(f.name) as result:
+            return json.load(result)
+    finally:
+        os.remove(f.name)
+
+### reporting
+def case_key(case):
+    return (case["format"], case["chunk_pages"], case["workers"], case["document"])
+
+# comparing results with a baseline - a case regresses when its throughput drops or its p95 latency rises by more than `tolerance`
+# each case also shows the stage whose time changed the most, e.g. the split when only the split backend differs
+def compare(results, baseline, tolerance):
+    baseline_cases = {case_key(case): case for case in baseline["cases"]}
+    rows, regressions = [], 0
+    for case in results["cases"]:
+        before = baseline_cases.get(case_key(case))
+        if before is None:
+            continue
+        if before.get("sha256") != case["sha256"]:
+            print(f"({case['document']}) differs from the baseline's copy - not compared")
+            continue
+        speed, p95 = case["pages_per_s"] / before["pages_per_s"] - 1, case["p95_s"] / before["p95_s"] - 1
+        regressed = speed < -tolerance or p95 > tolerance
+        regressions += regressed
+        changes = {stage: seconds / before["stages"][stage] - 1 for stage, seconds in case.get("stages", {}).items() if stage != "document" and before.get("stages", {}).get(stage)}
+        stage, change = max(changes.items(), key = lambda item: abs(item[1]), default = ("", None))
+        rows.append((*case_key(case), f"{speed:+.1%}", f"{p95:+.1%}", f"{stage} {change:+.1%}" if stage else "-", "REGRESSED" if regressed else ""))
+    print(table([("format", "chunk pages", "workers", "document", "pages/s", "p95", "biggest stage change", "")] + rows))
+    print(f"{regressions} of {len(rows)} cases regressed by more than {tolerance:.0%}")
+    return regressions
+
+def table(rows):
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(str(value).ljust(width) for value, width in zip(row, widths)) for row in rows)
+
+# running every format x chunk size x worker count over the corpus, writing the results to `output`
+# `fast_path` False sends even single-split PDFs through split and merge, to measure what the fast path saves, and
+# `split_backend` picks what builds the splits and `docx_converter` what converts DOCX splits
+def run(formats, chunk_sizes, worker_counts, corpus_kinds, corpus_sizes, corpus_dir, output, repeat = 3, warmup = 1, seed = 0, fast_path = True, split_backend = "spire",
+        docx_converter = "auto"):
+    documents = generate_corpus(corpus_dir, corpus_kinds, corpus_sizes, seed)
+    corpus = {info["document"]: info for info in map(describe, documents)}
+    results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": repeat, "seed": seed, "fast_path": fast_path, "split_backend": split_backend,
+               "docx_converter": docx_converter, "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()}, "cases": []}
+    rows = [("format", "chunk pages", "workers", "document", "pages/s", "p50 s", "p95 s", "peak MB", "worker peak MB")]
+    for output_format in formats:
+        for chunk_pages in chunk_sizes:
+            for workers in worker_counts:
+                print(f"Benchmarking {output_format}, {chunk_pages or 'planned'} pages per split, {workers} workers...")
+                measured = measure(output_format, chunk_pages, workers, documents, repeat, warmup, fast_path, split_backend, docx_converter)
+                for result in measured["results"]:
+                    info, seconds = corpus[result["document"]], result["seconds"]
+                    case = {"format": output_format, "chunk_pages": chunk_pages, "workers": workers, **info, "seconds": seconds,
+                            "p50_s": percentile(seconds, 0.5), "p95_s": percentile(seconds, 0.95), "pages_per_s": round(info["pages"] / percentile(seconds, 0.5), 2),
+                            "peak_rss_mb": measured["peak_rss_mb"], "worker_peak_rss_mb": measured["worker_peak_rss_mb"], "stages": result["stages"]}
+                    results["cases"].append(case)
+                    rows.append((output_format, chunk_pages or "planned", workers, case["document"], case["pages_per_s"], f"{case['p50_s']:.2f}",
+                                 f"{case['p95_s']:.2f}", case["peak_rss_mb"], case["worker_peak_rss_mb"] or "-"))
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent = 2)
+    print(table(rows))
+    print(f"Results written to {output}")
+    return results
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark PDF to DOCX/PPTX conversion on a synthetic corpus.")
+    parser.add_argument("--formats", nargs = "+", choices = ["docx", "pptx"], default = ["docx", "pptx"])
+    parser.add_argument("--chunk-pages", nargs = "+", type = int, default = [0, 10], help = "pages per split, 0 for the chunk planner")
+    parser.add_argument("--workers", nargs = "+", type = int, default = [1, os.cpu_count() or 1], help = "worker processes converting splits")
+    parser.add_argument("--kinds", nargs = "+", choices = kinds, default = list(kinds))
+    parser.add_argument("--sizes", nargs = "+", type = int, default = list(sizes), help = "page counts of the generated PDFs")
+    parser.add_argument("--corpus", default = "benchmarks/corpus", help = "directory the generated PDFs are kept in")
+    parser.add_argument("--output", default = "benchmarks/results.json")
+    parser.add_argument("--repeat", type = int, default = 3, help = "conversions of each PDF per case")
+    parser.add_argument("--warmup", type = int, default = 1, help = "unmeasured conversions before each case")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--no-fast-path", dest = "fast_path", action = "store_false", help = "split and merge PDFs that fit in one split too (FAST_PATH=0)")
+    parser.add_argument("--split-backend", choices = ["spire", "pymupdf"], default = "spire", help = "what builds the splits (SPLIT_BACKEND)")
+    parser.add_argument("--docx-converter", choices = ["auto", "spire", "pdf2docx"], default = "auto", help = "what converts DOCX splits (DOCX_CONVERTER)")
+    parser.add_argument("--baseline", help = "results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type = float, default = 0.1, help = "slowdown allowed before a case counts as regressed (0.1 is 10%%)")
+    parser.add_argument("--save-baseline", action = "store_true", help = "also store these results as the baseline")
+    parser.add_argument("--run-case", help = argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        return run_case(args.run_case)
+    results = run(sorted(set(args.formats)), sorted(set(args.chunk_pages)), sorted(set(args.workers)), args.kinds, args.sizes, args.corpus, args.output, args.repeat, args.warmup, args.seed, args.fast_path, args.split_backend,
+                  args.docx_converter)
+    if args.baseline and args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Baseline stored at {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            return 1 if compare(results, json.load(f), args.tolerance) else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,210 @@
+"""
+the bulk conversion front end - converts every matching PDF in a directory with the conversion engine,
+either feeding the splits of every document into one shared pool or converting several documents at a time,
+keeping a manifest so an interrupted run picks up where it stopped.
+
+usage: python -m ilikepdf.bulk --format docx --input pdf-docx/to-convert --output pdf-docx/working --chunk-workers 8
+       python -m ilikepdf.bulk --format docx --input pdf-docx/to-convert --output pdf-docx/working --pages 1-5
+       python -m ilikepdf.bulk --format docx --input pdf-docx/to-convert --output pdf-docx/working --schedule documents --workers 4
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import shutil
+import signal
+import time
+import multiprocessing as mp
+from io import BytesIO
+from multiprocessing.connection import wait
+from . import metrics, settings
+from .engine import ConversionEngine
+from .scheduler import ChunkScheduler
+
+class Manifest:
+    """Per-file status of a bulk run (in_progress, done or failed), saved as JSON after every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, pdf):
+        return self.entries.get(pdf, {})
+
+    # recording a file's new status along with any details about it, then saving the manifest
+    def mark(self, pdf, status, **details):
+        self.entries[pdf] = {"status": status, "updated": time.time(), **details}
+        temp_path = f"{self.path}.tmp" # written aside and renamed, so a crash never leaves a half-written manifest
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f, indent = 2)
+        os.replace(temp_path, self.path)
+
+# converting one PDF - runs in its own process so it can be killed when it takes longer than the timeout
+def convert_one(output_format, pdf_path, pdf_name, output_dir, chunk_workers, conn, pages = None):
+    if hasattr(os, "setsid"):
+        os.setsid() # its own process group, so a timeout also kills the document's chunk workers
+    try:
+        engine = ConversionEngine(output_format, output_dir, workers = chunk_workers)
+        output_path = f"{output_dir}/{pdf_name}/{pdf_name}.{engine.backend.ext}"
+        os.makedirs(f"{output_dir}/{pdf_name}", exist_ok = True)
+
+        # cache hits and in-memory conversions are written to where a file-based conversion would have left them
+        result = engine.convert(pdf_path, pdf_name, pages = pages)
+        if isinstance(result, BytesIO):
+            with open(output_path, "wb") as f:
+                f.write(result.getvalue())
+        elif result != output_path:
+            shutil.copyfile(result, output_path)
+        conn.send({"status": "done", "cached": engine.cache.stats["hits"] > 0, "metrics": metrics.registry.snapshot()})
+    except Exception as e:
+        conn.send({"status": "failed", "error": str(e), "failed_chunks": getattr(e, "failures", None), "metrics": metrics.registry.snapshot()})
+    finally:
+        conn.close()
+
+# killing a document's process, along with its chunk workers where process groups are available
+def kill(process):
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    process.kill()
+    process.join()
+
+# the directory each PDF's output goes in - its whole name but the extension (`report.v1.pdf` goes in `report.v1`), with
+# `-2`, `-3` and so on added to names that would clash with one already taken, also when they differ only in case
+def output_names(pdfs):
+    names, taken = {}, set()
+    for pdf in pdfs:
+        stem = name = os.path.splitext(pdf)[0]
+        suffix = 1
+        while name.lower() in taken:
+            suffix += 1
+            name = f"{stem}-{suffix}"
+        taken.add(name.lower())
+        names[pdf] = name
+    return names
+
+# converting every PDF in `input_dir` matching `pattern` to `output_format` - only their `pages` (e.g. "1-5,8") when given -
+# outputs organised in `{output_dir}/{pdf_name}`
+def convert_directory(output_format, input_dir, output_dir, workers = 1, pattern = "*.pdf", timeout = None, chunk_workers = None, schedule = "chunks", pages = None):
+    os.makedirs(output_dir, exist_ok = True)
+    manifest = Manifest(f"{output_dir}/manifest.json")
+    ext = output_format
+
+    # skipping files the manifest has as done in an earlier run, for the same selection of pages, whose output is still
+    # there and newer than the PDF itself - anything that failed, timed out or never finished is converted again
+    queue, summary = [], {"done": 0, "cached": 0, "failed": 0, "timed out": 0, "skipped": 0}
+    pdf_names = output_names(sorted(fnmatch.filter(os.listdir(input_dir), pattern)))
+    for pdf, pdf_name in pdf_names.items():
+        pdf_path, entry = f"{input_dir}/{pdf}", manifest.get(pdf)
+        output_path = f"{output_dir}/{pdf_name}/{pdf_name}.{ext}"
+        if (entry.get("status") == "done" and entry.get("pages") == pages and os.path.exists(output_path)
+                and os.path.getmtime(output_path) >= os.path.getmtime(pdf_path)):
+            summary["skipped"] += 1
+            continue
+        queue.append((pdf, pdf_path, pdf_name))
+    print(f"{len(queue)} PDFs to convert, {summary['skipped']} already converted")
+
+    # recording each document's outcome in the manifest and the summary
+    def record(pdf, status, **details):
+        if status == "in_progress":
+            print(f"Converting ({pdf})...")
+        elif details.pop("timed_out", False):
+            summary["timed out"] += 1
+            print(f"({pdf}) timed out after {timeout}s")
+        else:
+            summary["cached"] += bool(details.pop("cached", False))
+            summary[status] += 1
+            print(f"({pdf}) {status} in {details.get('seconds')}s")
+        manifest.mark(pdf, status, output = f"{output_dir}/{pdf_names[pdf]}/{pdf_names[pdf]}.{ext}", **details, **({"pages": pages} if pages else {}))
+
+    if schedule == "chunks":
+        # one pool shared by every document - `workers` is ignored, the pool is as big as the chunk workers allow
+        ChunkScheduler(output_format, output_dir, chunk_workers or settings.max_workers, timeout, record, pages).run(queue)
+    else:
+        # cores are shared between documents, so each document gets an equal part of the chunk workers
+        convert_documents(output_format, output_dir, queue, workers, timeout, chunk_workers or max(1, settings.max_workers // workers), record, pages)
+
+    print(", ".join(f"{count} {outcome}" for outcome, count in summary.items()))
+    if metrics.registry.stages:
+        print(metrics.registry.table())
+    return summary
+
+# converting `workers` documents at a time, each in its own process with its own chunk pool, killed past the timeout
+def convert_documents(output_format, output_dir, queue, workers, timeout, chunk_workers, record, pages = None):
+    context = mp.get_context("spawn") # a fresh interpreter per document, Spire's native state isn't fork-safe
+    running = {} # sentinel -> (process, connection, pdf, started)
+    queue = list(queue)
+    while queue or running:
+        # starting documents until every worker slot is busy
+        while queue and len(running) < workers:
+            pdf, pdf_path, pdf_name = queue.pop(0)
+            parent_conn, child_conn = context.Pipe(duplex = False)
+            process = context.Process(target = convert_one, args = (output_format, pdf_path, pdf_name, output_dir, chunk_workers, child_conn, pages))
+            process.start()
+            child_conn.close()
+            running[process.sentinel] = (process, parent_conn, pdf, time.time())
+            record(pdf, "in_progress", pid = process.pid)
+
+        # waiting for a document to send its result or exit, waking up in time to enforce the earliest timeout - its result is
+        # read as soon as it's sent, since a result bigger than the pipe's buffer keeps the process from exiting until it is
+        wait_for = None
+        if timeout:
+            wait_for = max(0, min(started for _, _, _, started in running.values()) + timeout - time.time())
+        handles = {}
+        for sentinel, (_, conn, _, _) in running.items():
+            handles[sentinel] = handles[conn] = sentinel
+        for ready in wait(list(handles), timeout = wait_for):
+            if handles[ready] not in running:
+                continue # already handled through its other handle
+            process, conn, pdf, started = running.pop(handles[ready])
+            try:
+                result = conn.recv() if conn.poll() else None
+            except EOFError: # exited partway through sending
+                result = None
+            process.join(timeout)
+            if process.is_alive(): # sent its result but never exited
+                kill(process)
+            if result is None:
+                result = {"status": "failed", "error": f"worker exited with code {process.exitcode}"}
+            metrics.registry.absorb(result.pop("metrics", []))
+            conn.close()
+            record(pdf, result.pop("status"), seconds = round(time.time() - started, 2), **result)
+
+        # killing documents that ran past the timeout, so one pathological PDF can't stall the batch
+        if timeout:
+            for sentinel, (process, conn, pdf, started) in list(running.items()):
+                if time.time() - started > timeout:
+                    kill(process)
+                    conn.close()
+                    del running[sentinel]
+                    record(pdf, "failed", error = f"timed out after {timeout}s", seconds = round(time.time() - started, 2), timed_out = True)
+
+# command-line entry point - `defaults` pre-fill the arguments, as the scripts in pipelines-for-bulk-conversion do
+def main(argv = None, **defaults):
+    parser = argparse.ArgumentParser(description = "Convert every PDF in a directory to DOCX or PPTX.")
+    parser.add_argument("--format", dest = "output_format", choices = ["docx", "pptx"], help = "output format")
+    parser.add_argument("--input", dest = "input_dir", help = "directory containing the PDFs to convert")
+    parser.add_argument("--output", dest = "output_dir", help = "directory the converted files are organised in, one sub-directory per PDF")
+    parser.add_argument("--schedule", choices = ["chunks", "documents"], default = "chunks",
+                        help = "chunks: one pool converts the splits of every PDF, largest first (default); documents: one process per PDF")
+    parser.add_argument("--workers", type = int, default = 1, help = "PDFs converted at the same time, with --schedule documents")
+    parser.add_argument("--chunk-workers", type = int, help = "processes converting splits - the shared pool's size, or each PDF's share of CONVERT_WORKERS with --schedule documents")
+    parser.add_argument("--glob", dest = "pattern", default = "*.pdf", help = "only convert files matching this pattern")
+    parser.add_argument("--pages", help = "only convert these pages of every PDF, e.g. 1-5,8,10- (1-based, \"10-\" runs to the last page)")
+    parser.add_argument("--timeout", type = float, help = "seconds after which a single PDF is killed and marked failed")
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+    if not (args.output_format and args.input_dir and args.output_dir):
+        parser.error("--format, --input and --output are required")
+
+    summary = convert_directory(args.output_format, args.input_dir, args.output_dir, args.workers, args.pattern, args.timeout, args.chunk_workers, args.schedule, args.pages)
+    return 1 if summary["failed"] or summary["timed out"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
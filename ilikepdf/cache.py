@@ -0,0 +1,93 @@
+"""
+content-addressed caches of converted files on local disk.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from io import BytesIO
+from . import settings
+
+class FileCache:
+    """Converted files in `directory` named by key, evicted least recently used once they pass `max_mb`."""
+
+    def __init__(self, directory, ext, max_mb):
+        self.directory = directory
+        self.ext = ext
+        self.max_mb = max_mb
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok = True)
+
+    @property
+    def enabled(self):
+        return self.max_mb > 0
+
+    # looking up a file - returns its path on a hit, None on a miss
+    def get(self, key):
+        if not self.enabled or not key:
+            return None
+        cache_path = f"{self.directory}/{key}.{self.ext}"
+        with self.lock:
+            if os.path.exists(cache_path):
+                os.utime(cache_path) # the modification time doubles as the last-used time for LRU eviction
+                self.stats["hits"] += 1
+                return cache_path
+            self.stats["misses"] += 1
+        return None
+
+    # storing a file given as a path, bytes or BytesIO, then evicting until the cache fits its cap
+    def put(self, key, result):
+        if not self.enabled or not key:
+            return
+        cache_path = f"{self.directory}/{key}.{self.ext}"
+        temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp" # written aside and renamed, so readers never see a partial file
+        if isinstance(result, (bytes, BytesIO)):
+            with open(temp_path, "wb") as f:
+                f.write(result.getvalue() if isinstance(result, BytesIO) else result)
+        else:
+            shutil.copyfile(result, temp_path)
+        os.replace(temp_path, cache_path)
+        self.evict()
+
+    # evicting least recently used files until the cache fits in max_mb
+    def evict(self):
+        with self.lock:
+            entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in os.scandir(self.directory) if entry.name.endswith(f".{self.ext}"))
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total_size <= self.max_mb * 1024 * 1024:
+                    break
+                os.remove(path)
+                total_size -= size
+                self.stats["evictions"] += 1
+
+    # counters plus the cache's current file count and size
+    def summary(self):
+        with self.lock:
+            summary = dict(self.stats)
+            sizes = [entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(f".{self.ext}")] if self.enabled else []
+        summary["files"], summary["bytes"] = len(sizes), sum(sizes)
+        return summary
+
+# what a converted file of format `ext` depends on besides its pages - the format and, for DOCX, how splits are routed between converters
+def output_tag(ext):
+    return f"{ext}|{settings.docx_converter}|{settings.plain_text_max_paint_ops}" if ext == "docx" else ext
+
+# cache key for a whole document - the PDF (a path or its bytes), the target format, the options that decide how it's split,
+# the `selection` of pages converted, when it isn't every page, and the optimisation targets, when the output is optimised
+def cache_key(pdf, ext, selection = None):
+    if isinstance(pdf, str):
+        with open(pdf, "rb") as f:
+            key = hashlib.file_digest(f, "sha256")
+    else:
+        key = hashlib.sha256(pdf)
+    key.update(f"{output_tag(ext)}|{settings.chunk_pages}|{settings.chunk_memory_budget_mb}|{settings.min_chunk_pages}|{settings.max_chunk_pages}".encode())
+    if selection is not None:
+        key.update(f"|pages {selection}".encode())
+    if settings.optimise_output:
+        key.update(f"|optimised {settings.optimise_dpi} {settings.optimise_jpeg_quality}".encode())
+    return key.hexdigest()
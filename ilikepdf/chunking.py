@@ -0,0 +1,186 @@
+"""
+planning, fingerprinting and (with SPLIT_BACKEND=pymupdf) building splits - PyMuPDF reads the page tree and content
+streams without rendering anything.
+"""
+
+import hashlib
+import re
+import fitz # PyMuPDF
+from . import settings
+from .cache import output_tag
+
+# opening a PDF with PyMuPDF from either a path or the PDF's bytes
+def open_fitz(pdf):
+    return fitz.open(pdf) if isinstance(pdf, str) else fitz.open(stream = pdf, filetype = "pdf")
+
+# number of pages in a PDF (a path or its bytes)
+def page_count(pdf):
+    with open_fitz(pdf) as doc:
+        return doc.page_count
+
+# the 0-based pages picked by a 1-based `spec` such as "1-5,8,10-" ("10-" runs to the last page, "-3" from the first),
+# in document order - or None when it picks every page
+def parse_pages(spec, page_count):
+    selection = set()
+    for part in str(spec).replace(" ", "").split(","):
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        try:
+            first, last = int(first or 1), int(last or page_count) if dash else int(first)
+        except ValueError:
+            raise ValueError(f"invalid page range: {part} (expected pages such as 1-5,8,10-)") from None
+        if not 1 <= first <= last:
+            raise ValueError(f"invalid page range: {part}")
+        if last > page_count:
+            raise ValueError(f"page {last} is past the end of the document ({page_count} pages)")
+        selection.update(range(first - 1, last))
+    if not selection:
+        raise ValueError(f"no pages selected by {spec!r}")
+    return None if len(selection) == page_count else sorted(selection)
+
+# splitting a list of pages into inclusive (first, last) runs of consecutive pages
+def page_runs(pages):
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][1] + 1:
+            runs[-1][1] = page
+        else:
+            runs.append([page, page])
+    return [tuple(run) for run in runs]
+
+# text-showing and path-painting operators in a content stream - delimited by whitespace, or by the string, array or
+# hex string before them, so names such as /F1 don't count
+text_operators = re.compile(rb"(?<![^\s)\]>])(?:Tj|TJ)(?![^\s\[(/<])")
+paint_operators = re.compile(rb"(?<![^\s)\]>])(?:S|s|f\*?|F|B\*?|b\*?)(?![^\s\[(/<])")
+
+# what a page is made of, from the counts `probe_pages` reports
+def page_kind(text_ops, images, paint_ops):
+    if text_ops and images:
+        return "mixed"
+    if images:
+        return "image"
+    if text_ops:
+        return "text"
+    return "vector" if paint_ops else "blank"
+
+# whether every probed page is plain text - text without images, and too few painted paths for tables or boxed layouts
+def plain_text(probes):
+    return all(probe["kind"] == "text" and probe["paint_ops"] <= settings.plain_text_max_paint_ops for probe in probes)
+
+# probing page signals for each of `pages` (every page by default) - read from the page's resources and a scan of its
+# content stream, without parsing text or rendering: content stream bytes, images, fonts, text-showing and path-painting
+# operators, objects (content streams, images, fonts and forms), and the page's kind (text, image, mixed, vector or blank)
+# operators are counted in the page's forms too - Spire's splits draw each page as one form
+def probe_pages(pdf, pages = None):
+    probes = []
+    with open_fitz(pdf) as doc:
+        for number in range(doc.page_count) if pages is None else pages:
+            page = doc[number]
+            contents = page.read_contents()
+            drawn = contents + b"\n".join(doc.xref_stream(xref) or b"" for xref, *_ in page.get_xobjects())
+            images, fonts = len(page.get_images(full = False)), len(page.get_fonts(full = False))
+            text_ops, paint_ops = len(text_operators.findall(drawn)), len(paint_operators.findall(drawn))
+            probes.append({"content_bytes": len(contents), "images": images, "fonts": fonts, "text_ops": text_ops, "paint_ops": paint_ops,
+                           "objects": len(page.get_contents()) + images + fonts + len(page.get_xobjects()), "kind": page_kind(text_ops, images, paint_ops)})
+    return probes
+
+# planning splits, each one the list of the pages that go in it - out of `selection` only, when it's given
+# no split gets more than max_chunk_pages pages, even when `chunk_size` asks for more - Spire drops pages past it
+def plan_chunks(pdf, page_count, chunk_size = None, workers = settings.max_workers, selection = None):
+    pages = list(range(page_count)) if selection is None else list(selection)
+    if chunk_size:
+        chunk_size = min(chunk_size, settings.max_chunk_pages)
+        return [pages[i:i + chunk_size] for i in range(0, len(pages), chunk_size)]
+
+    # spread the pages over every worker, without letting splits get small enough for overhead to dominate
+    page_cap = min(settings.max_chunk_pages, max(settings.min_chunk_pages, -(-len(pages) // max(workers, 1))))
+    plan, chunk, chunk_mb = [], [], 0
+    for page, probe in zip(pages, probe_pages(pdf, selection)):
+        page_mb = settings.page_base_mb + probe["content_bytes"] / 1024 * settings.content_mb_per_kb + probe["images"] * settings.image_mb
+        # close the current split when it's full or this page would push it over the memory budget
+        if chunk and (len(chunk) >= page_cap or chunk_mb + page_mb > settings.chunk_memory_budget_mb):
+            plan.append(chunk)
+            chunk, chunk_mb = [], 0
+        chunk.append(page)
+        chunk_mb += page_mb
+    if chunk:
+        plan.append(chunk)
+    return plan
+
+# building every planned split with PyMuPDF - each split's runs of pages copied out of the PDF (a path or its bytes) in
+# one pass, instead of loading the whole document into Spire - written to `paths` when they're given, otherwise returned as bytes
+def split_with_pymupdf(pdf, plan, paths = None):
+    splits = []
+    with open_fitz(pdf) as source:
+        for i, pages in enumerate(plan):
+            with fitz.open() as doc:
+                for first, last in page_runs(pages):
+                    doc.insert_pdf(source, from_page = first, to_page = last)
+                if paths:
+                    doc.save(paths[i], garbage = 1)
+                    splits.append(paths[i])
+                else:
+                    splits.append(doc.tobytes(garbage = 1))
+    return splits
+
+# references to other objects in a PDF object's source, and the keys pointing back up the page tree (or from an
+# annotation back to its page), which are left out so a page's hash never depends on the document around it
+object_reference = re.compile(rb"(\d+) 0 R")
+parent_keys = ("Parent", "P")
+parent_reference = re.compile(rb"/(?:Parent|P)\s+\d+ 0 R")
+
+# an object's source with a dictionary's keys in sorted order - producers write the same dictionary in different orders
+def canonical_source(doc, xref):
+    keys = doc.xref_get_keys(xref)
+    if not keys:
+        return doc.xref_object(xref, compressed = True).encode()
+    return "".join(f"/{key} {doc.xref_get_key(xref, key)[1]}" for key in sorted(keys) if key not in parent_keys).encode()
+
+# a digest of object `xref` and everything it refers to - forms (recursively), fonts, images, graphics states, colour
+# spaces - with each reference replaced by the digest of the object it points to, so the same objects hash the same
+# whatever numbers they have in the file; references to other `pages` (e.g. from links) count as a page, not its content
+# `memo` caches digests across the pages of one document
+def object_digest(doc, xref, memo, pages, path = ()):
+    if path and xref in pages:
+        return b"page"
+    if xref in memo:
+        return memo[xref]
+    if xref in path or not 0 < xref < doc.xref_length(): # a reference cycle, or a dangling reference
+        return b"cycle" if xref in path else b"null"
+    source = parent_reference.sub(b"", canonical_source(doc, xref))
+    digest = hashlib.sha256(object_reference.sub(lambda match: object_digest(doc, int(match.group(1)), memo, pages, path + (xref,)), source))
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    memo[xref] = digest.hexdigest().encode()
+    return memo[xref]
+
+# the value of `key` a page inherits from the page tree when it doesn't set one itself, as PyMuPDF's (type, value)
+def inherited_key(doc, xref, key):
+    value, parent = doc.xref_get_key(xref, key), doc.xref_get_key(xref, "Parent")
+    while value[0] == "null" and parent[0] == "xref":
+        xref = int(parent[1].split()[0])
+        value, parent = doc.xref_get_key(xref, key), doc.xref_get_key(xref, "Parent")
+    return value
+
+# fingerprinting each planned split from its pages' position in the split, sizes, rotation and everything each page
+# draws with - its page object with every object it refers to, plus resources it inherits from the page tree - so
+# unchanged pages hash the same whichever document they come from, and any change to what they draw changes the hash
+def fingerprint_chunks(pdf, plan, ext):
+    fingerprints, memo = [], {}
+    with open_fitz(pdf) as doc:
+        pages = {doc.page_xref(number) for number in range(doc.page_count)}
+        for chunk in plan:
+            fingerprint = hashlib.sha256(output_tag(ext).encode())
+            for index, page in enumerate(map(doc.load_page, chunk)):
+                fingerprint.update(f"|{index}|{tuple(page.rect)}|{page.rotation}|".encode())
+                fingerprint.update(object_digest(doc, page.xref, memo, pages))
+                kind, value = inherited_key(doc, page.xref, "Resources")
+                if doc.xref_get_key(page.xref, "Resources")[0] != "null":
+                    continue # the page's own resources are part of its object's digest already
+                if kind == "xref":
+                    fingerprint.update(object_digest(doc, int(value.split()[0]), memo, pages, (page.xref,)))
+                elif kind == "dict":
+                    fingerprint.update(object_reference.sub(lambda match: object_digest(doc, int(match.group(1)), memo, pages, (page.xref,)), value.encode()))
+            fingerprints.append(fingerprint.hexdigest())
+    return fingerprints
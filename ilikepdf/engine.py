@@ -0,0 +1,529 @@
+"""
+the conversion engine - splits a PDF, converts the splits in parallel, merges them and removes Spire's watermarks,
+for whichever output backend it's given. both the Flask APIs and the bulk pipelines are front ends over it.
+"""
+
+import contextvars
+import copy
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from io import BytesIO
+from spire.pdf import PdfDocument
+from spire.pdf.common import Stream as PdfStream
+from . import metrics, settings
+from .backends import get_backend, released
+from .cache import FileCache, cache_key
+from .chunking import fingerprint_chunks, page_count, page_runs, parse_pages, plan_chunks, split_with_pymupdf
+from .optimise import optimise_package
+from .workers import WorkerPool
+
+class ChunkConversionError(Exception):
+    """Raised when one or more split PDFs fail to convert; `failures` maps each split to its error."""
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__("failed to convert " + ", ".join(f"{name} ({error})" for name, error in sorted(failures.items())))
+
+_pool = None
+
+# bounded pool of supervised worker processes, created on first use (with `workers` processes) and shared by every engine in the process
+def get_pool(workers = settings.max_workers):
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool(workers)
+    return _pool
+
+# converting every split with `convert`, on the worker pool unless there's only one worker - even a single split goes to the
+# pool, so conversions never run in the caller (e.g. a server's request thread) beside the recycled workers
+# `on_done(name, result)` is called as each split converts successfully, `progress(done, total)` after each split finishes either way
+# each split is measured where it runs and recorded as a `stage` metric, along with its `pages` (name -> count), the
+# `converters` it was routed to (name -> converter) and `fields`
+def run_chunks(convert, chunks, workers = settings.max_workers, progress = None, on_done = None, stage = "chunk", pages = None, converters = None, **fields):
+    # a failing split is recorded against its name and the remaining splits are still converted
+    results, failures = {}, {}
+
+    def finished(name, outcome):
+        ok, value, measured = outcome
+        metrics.record(stage, chunk = name, status = "ok" if ok else "error", pages = (pages or {}).get(name), converter = (converters or {}).get(name), bytes_in = metrics.size_of(chunks[name][0]),
+                       bytes_out = metrics.size_of(value) if ok else 0, **measured, **fields, **({} if ok else {"error": value}))
+        if ok:
+            results[name] = value
+            if on_done:
+                on_done(name, value)
+        else:
+            failures[name] = value
+        if progress:
+            progress(len(results) + len(failures), len(chunks))
+
+    if workers <= 1:
+        for name, args in chunks.items():
+            finished(name, metrics.timed_call(convert, *args))
+    else:
+        futures = {get_pool(workers).submit(metrics.timed_call, convert, *args): name for name, args in chunks.items()}
+        for future in as_completed(futures):
+            try:
+                outcome = future.result()
+            except Exception as e: # the worker died - there's nothing measured to report
+                outcome = (False, str(e), {})
+            finished(futures[future], outcome)
+
+    if failures:
+        raise ChunkConversionError(failures)
+    return results # mapping each split's name to what `convert` returned for it
+
+class InOrder:
+    """Collects converted splits finishing in any order, passing each one to `merger.append` once every split before it has been passed."""
+
+    def __init__(self, names, merger = None):
+        self.names = names
+        self.merger = merger
+        self.results = {}
+        self.appended = 0
+
+    def ready(self, name, result):
+        self.results[name] = result
+        while self.appended < len(self.names) and self.names[self.appended] in self.results:
+            if self.merger:
+                self.merger.append(self.results[self.names[self.appended]])
+            self.appended += 1
+
+    # every split's result, in page order
+    def ordered(self):
+        return [self.results[name] for name in self.names]
+
+# copying `pages` of the Spire document `source` into `doc`, one InsertPageRange per run of consecutive pages
+def insert_pages(doc, source, pages):
+    for first, last in page_runs(pages):
+        doc.InsertPageRange(source, first, last)
+
+# progress callback for callers that don't track progress
+def no_progress(stage, done = None, total = None):
+    pass
+
+class ConversionEngine:
+    """Converts PDFs to one output format, keeping each document's files under `{working_dir}/{pdf_name}`."""
+
+    def __init__(self, backend, working_dir, cache_dir = None, workers = settings.max_workers):
+        self.backend = get_backend(backend) if isinstance(backend, str) else backend
+        self.working_dir = working_dir
+        self.workers = workers
+        os.makedirs(working_dir, exist_ok = True)
+
+        cache_dir = cache_dir or settings.cache_dir or os.path.join(os.path.dirname(working_dir), "cache")
+        self.cache = FileCache(cache_dir, self.backend.ext, settings.cache_max_mb)
+        self.chunk_cache = FileCache(f"{cache_dir}/chunks", self.backend.ext, settings.chunk_cache_max_mb)
+
+    # this engine keeping document files under `working_dir` instead, e.g. one request's workspace - the caches are shared
+    def in_workspace(self, working_dir):
+        engine = copy.copy(self)
+        engine.working_dir = working_dir
+        return engine
+
+    # step 1 - splitting a PDF file into split PDF files, one per planned split - planned here, out of the `selection` of pages
+    # when there is one, unless a `plan` is given - built by Spire or PyMuPDF, as `split_backend` says
+    def split_pdf(self, pdf_path, pdf_name, chunk_size = settings.chunk_pages, plan = None, selection = None):
+        split_pdf_dir = f"{self.working_dir}/{pdf_name}/split_pdfs"
+        os.makedirs(split_pdf_dir, exist_ok = True)
+        if settings.split_backend == "pymupdf":
+            plan = plan or plan_chunks(pdf_path, page_count(pdf_path), chunk_size, self.workers, selection)
+            split_pdf_paths = split_with_pymupdf(pdf_path, plan, [f"{split_pdf_dir}/Split-{i + 1}.pdf" for i in range(len(plan))])
+            return split_pdf_paths, fingerprint_chunks(pdf_path, plan, self.backend.ext)
+
+        split_pdf_paths = []
+        with released(PdfDocument()) as target_doc:
+            target_doc.LoadFromFile(pdf_path)
+            plan = plan or plan_chunks(pdf_path, target_doc.Pages.Count, chunk_size, self.workers, selection)
+            # each split is saved and closed before the next is built
+            for i, pages in enumerate(plan):
+                split_pdf_paths.append(f"{split_pdf_dir}/Split-{i + 1}.pdf")
+                with released(PdfDocument()) as doc:
+                    insert_pages(doc, target_doc, pages)
+                    doc.SaveToFile(split_pdf_paths[-1])
+        return split_pdf_paths, fingerprint_chunks(pdf_path, plan, self.backend.ext) # returning the split PDFs' paths and their fingerprints, in page order
+
+    # step 1, in memory - splitting a PDF's bytes into split PDFs' bytes
+    def split_pdf_stream(self, pdf_bytes, chunk_size = settings.chunk_pages, plan = None, selection = None):
+        if settings.split_backend == "pymupdf":
+            plan = plan or plan_chunks(pdf_bytes, page_count(pdf_bytes), chunk_size, self.workers, selection)
+            return split_with_pymupdf(pdf_bytes, plan), fingerprint_chunks(pdf_bytes, plan, self.backend.ext)
+
+        splits = []
+        # loaded through the constructor, Spire's one-argument LoadFromStream isn't exported by its native library
+        with released(PdfStream(pdf_bytes)) as source_stream, released(PdfDocument(source_stream)) as target_doc:
+            plan = plan or plan_chunks(pdf_bytes, target_doc.Pages.Count, chunk_size, self.workers, selection)
+            for pages in plan:
+                with released(PdfDocument()) as doc, released(PdfStream()) as stream:
+                    insert_pages(doc, target_doc, pages)
+                    doc.SaveToStream(stream)
+                    splits.append(stream.ToArray())
+        return splits, fingerprint_chunks(pdf_bytes, plan, self.backend.ext) # returning the split PDFs' bytes and their fingerprints, in page order
+
+    # step 2 - converting split PDF files (in page order), reusing any split whose pages were converted before and sending
+    # each of the rest to the converter the backend routes it to
+    # with a `merger`, each converted split is appended to it as soon as every split before it is converted too
+    def convert_pdf(self, split_pdf_paths, pdf_name, fingerprints = None, progress = None, merger = None, pages = None):
+        ext = self.backend.ext
+        split_output_dir = f"{self.working_dir}/{pdf_name}/split_{ext}s"
+        os.makedirs(split_output_dir, exist_ok = True)
+
+        names = [os.path.basename(split_pdf_path).rsplit(".", 1)[0] for split_pdf_path in split_pdf_paths]
+        fingerprints, chunks = dict(zip(names, fingerprints or [])), {}
+        in_order = InOrder(names, merger)
+        for split_name, split_pdf_path in zip(names, split_pdf_paths):
+            # splits found in the chunk cache are copied, only the rest go to Spire
+            cached_path = self.chunk_cache.get(fingerprints.get(split_name))
+            if cached_path:
+                shutil.copyfile(cached_path, f"{split_output_dir}/{split_name}.{ext}")
+                in_order.ready(split_name, f"{split_output_dir}/{split_name}.{ext}")
+            else:
+                chunks[split_name] = (split_pdf_path, f"{split_output_dir}/{split_name}.{ext}", self.backend.route(split_pdf_path))
+
+        def converted(split_name, output_path):
+            self.chunk_cache.put(fingerprints.get(split_name), output_path)
+            in_order.ready(split_name, output_path)
+
+        run_chunks(self.backend.convert_chunk, chunks, self.workers, progress, converted, pages = dict(zip(names, pages or [])),
+                   converters = {name: args[-1] for name, args in chunks.items()}, format = ext, document = pdf_name)
+        return in_order.ordered() # returning the converted splits' paths, in page order
+
+    # step 2, in memory - converting split PDFs' bytes, reusing any split whose pages were converted before and routing the rest
+    def convert_pdf_stream(self, split_pdfs, fingerprints = None, progress = None, merger = None, pages = None, pdf_name = None):
+        names = [f"Split-{i + 1}" for i in range(len(split_pdfs))]
+        fingerprints, chunks = dict(zip(names, fingerprints or [])), {}
+        in_order = InOrder(names, merger)
+        for split_name, split in zip(names, split_pdfs):
+            cached_path = self.chunk_cache.get(fingerprints.get(split_name))
+            if cached_path:
+                with open(cached_path, "rb") as f:
+                    in_order.ready(split_name, f.read())
+            else:
+                chunks[split_name] = (split, self.backend.route(split))
+
+        def converted(split_name, output):
+            self.chunk_cache.put(fingerprints.get(split_name), output)
+            in_order.ready(split_name, output)
+
+        run_chunks(self.backend.convert_chunk_stream, chunks, self.workers, progress, converted, pages = dict(zip(names, pages or [])),
+                   converters = {name: args[-1] for name, args in chunks.items()}, format = self.backend.ext, document = pdf_name)
+        return in_order.ordered() # returning the converted splits' bytes, in page order
+
+    # step 3 - merging converted splits, given in page order, into one file with Spire watermarks - a single split is already that file
+    def merge(self, split_paths, pdf_name, workers = None):
+        if len(split_paths) == 1:
+            return split_paths[0]
+        merge_dir = f"{self.working_dir}/{pdf_name}/temp-output"
+        os.makedirs(merge_dir, exist_ok = True)
+        if settings.merge_strategy == "tree":
+            split_paths = self.merge_tree(split_paths, merge_dir, workers)
+        return self.backend.merge(split_paths, f"{merge_dir}/{pdf_name}-spire.{self.backend.ext}")
+
+    # merging neighbouring groups of `merge_fan_in` splits in parallel, level by level, until one group is left for the final merge
+    # - splits are paths merged into `merge_dir`, or bytes merged in memory without one
+    def merge_tree(self, splits, merge_dir = None, workers = None):
+        fan_in, level = max(2, settings.merge_fan_in), 0
+        while len(splits) > fan_in:
+            level += 1
+            groups = {f"Merge-{level}-{i // fan_in + 1}": splits[i:i + fan_in] for i in range(0, len(splits), fan_in)}
+            if merge_dir:
+                merged = run_chunks(self.backend.merge, {name: (group, f"{merge_dir}/{name}.{self.backend.ext}") for name, group in groups.items()}, workers or self.workers,
+                                    stage = "tree_merge", format = self.backend.ext)
+            else:
+                merged = run_chunks(self.backend.merge_stream, {name: (group,) for name, group in groups.items()}, workers or self.workers, stage = "tree_merge", format = self.backend.ext)
+            splits = [merged[name] for name in groups]
+        return splits
+
+    # the merger `splits` splits are appended to while they convert, or a placeholder when they're merged after conversion
+    # instead, or when there's only one split and nothing to merge
+    def merger(self, splits = 2):
+        return self.backend.merger() if settings.merge_strategy == "incremental" and splits > 1 else nullcontext()
+
+    # step 4 - removing Spire watermarks, writing the final file
+    def remove_watermarks(self, spire_path, pdf_name):
+        return self.backend.remove_watermarks(spire_path, f"{self.working_dir}/{pdf_name}/{pdf_name}.{self.backend.ext}")
+
+    # step 5, with OPTIMISE_OUTPUT=1 - shrinking the final file, a path rewritten in place or a BytesIO returned as a new one
+    def optimise(self, output, pdf_name, progress = no_progress):
+        if not settings.optimise_output:
+            return output
+        progress("optimise")
+        bytes_in = metrics.size_of(output)
+        optimised = output if isinstance(output, str) else BytesIO()
+        with metrics.Stage("optimise", format = self.backend.ext, document = pdf_name, bytes_in = bytes_in) as stage:
+            stats = optimise_package(output, optimised)
+            bytes_out = metrics.size_of(optimised)
+            stage.update(bytes_out = bytes_out, bytes_saved = bytes_in - bytes_out, **stats)
+        metrics.annotate_document(bytes_saved = bytes_in - bytes_out)
+        print(f"({pdf_name}) optimised - {bytes_in / 2**20:.1f} MB to {bytes_out / 2**20:.1f} MB, {(bytes_in - bytes_out) / max(bytes_in, 1):.0%} saved "
+              f"({stats['images_reencoded']} images re-encoded, {stats['images_downsampled']} downsampled, {stats['parts_deduplicated']} duplicates removed)")
+        if not isinstance(optimised, str):
+            optimised.seek(0)
+        return optimised
+
+    # removing a document's intermediate files once its final file exists
+    def cleanup(self, pdf_name):
+        if settings.keep_intermediates:
+            return
+        for intermediate in ("split_pdfs", f"split_{self.backend.ext}s", "temp-output"):
+            shutil.rmtree(f"{self.working_dir}/{pdf_name}/{intermediate}", ignore_errors = True)
+
+    # the whole pipeline through the working directory - returns the final file's path
+    def convert_file(self, pdf_path, pdf_name, progress = no_progress, plan = None):
+        split_pdf_paths, fingerprints, pages = self.split_file(pdf_path, pdf_name, progress, plan)
+        output_path = self.convert_split_files(split_pdf_paths, fingerprints, pages, pdf_name, progress)
+        self.cleanup(pdf_name)
+        return output_path
+
+    # the split step of the working-directory pipeline - returns the split PDFs' paths, their fingerprints and page counts
+    def split_file(self, pdf_path, pdf_name, progress = no_progress, plan = None, selection = None):
+        print(f"Splitting ({pdf_name}) at {pdf_path}...")
+        progress("split")
+        with metrics.Stage("split", format = self.backend.ext, document = pdf_name, bytes_in = metrics.size_of(pdf_path)) as stage:
+            split_pdf_paths, fingerprints = self.split_pdf(pdf_path, pdf_name, plan = plan, selection = selection)
+            pages = [page_count(split_pdf_path) for split_pdf_path in split_pdf_paths]
+            stage.update(pages = sum(pages), chunks = len(pages), bytes_out = metrics.size_of(split_pdf_paths))
+        metrics.annotate_document(pages = sum(pages), chunks = len(pages))
+        return split_pdf_paths, fingerprints, pages
+
+    # the rest of the working-directory pipeline - converting, merging, removing watermarks from and optimising split PDFs already on disk
+    def convert_split_files(self, split_pdf_paths, fingerprints, pages, pdf_name, progress = no_progress):
+        label, ext = self.backend.label, self.backend.ext
+        print(f"({pdf_name}) split into {len(split_pdf_paths)} PDFs. Converting to {label}...")
+        with self.merger(len(split_pdf_paths)) as merger:
+            with metrics.Stage("convert", format = ext, document = pdf_name, pages = sum(pages), chunks = len(pages)) as stage:
+                split_output_paths = self.convert_pdf(split_pdf_paths, pdf_name, fingerprints, lambda done, total: progress("convert", done, total), merger, pages)
+                stage.update(bytes_in = metrics.size_of(split_pdf_paths), bytes_out = metrics.size_of(split_output_paths))
+            print(f"({pdf_name})'s splits converted into {label}. Merging into one {label}...")
+            progress("merge")
+            with metrics.Stage("merge", format = ext, document = pdf_name, bytes_in = metrics.size_of(split_output_paths)) as stage:
+                if merger:
+                    os.makedirs(f"{self.working_dir}/{pdf_name}/temp-output", exist_ok = True)
+                    spire_path = merger.save(f"{self.working_dir}/{pdf_name}/temp-output/{pdf_name}-spire.{ext}")
+                else:
+                    spire_path = self.merge(split_output_paths, pdf_name)
+                stage.update(bytes_out = metrics.size_of(spire_path))
+        print(f"({spire_path.rsplit('.', 1)[0]}) created. Removing watermarks...")
+        progress("watermarks")
+        with metrics.Stage("watermarks", format = ext, document = pdf_name, bytes_in = metrics.size_of(spire_path)) as stage:
+            output_path = self.remove_watermarks(spire_path, pdf_name)
+            stage.update(bytes_out = metrics.size_of(output_path))
+        output_path = self.optimise(output_path, pdf_name, progress)
+        print(f"({pdf_name}) converted to {label}!\n")
+        return output_path
+
+    # the whole pipeline in memory - returns the final file in a BytesIO
+    def convert_bytes(self, pdf_bytes, pdf_name, progress = no_progress, plan = None):
+        split_pdfs, fingerprints, pages = self.split_bytes(pdf_bytes, pdf_name, progress, plan)
+        return self.convert_split_bytes(split_pdfs, fingerprints, pages, pdf_name, progress)
+
+    # the split step of the in-memory pipeline - returns the split PDFs' bytes, their fingerprints and page counts
+    def split_bytes(self, pdf_bytes, pdf_name, progress = no_progress, plan = None, selection = None):
+        print(f"Splitting ({pdf_name}) in memory...")
+        progress("split")
+        with metrics.Stage("split", format = self.backend.ext, document = pdf_name, bytes_in = len(pdf_bytes)) as stage:
+            split_pdfs, fingerprints = self.split_pdf_stream(pdf_bytes, plan = plan, selection = selection)
+            pages = [page_count(split_pdf) for split_pdf in split_pdfs]
+            stage.update(pages = sum(pages), chunks = len(pages), bytes_out = metrics.size_of(split_pdfs))
+        metrics.annotate_document(pages = sum(pages), chunks = len(pages))
+        return split_pdfs, fingerprints, pages
+
+    # the rest of the in-memory pipeline - converting, merging, removing watermarks from and optimising split PDFs' bytes
+    def convert_split_bytes(self, split_pdfs, fingerprints, pages, pdf_name, progress = no_progress):
+        label, ext = self.backend.label, self.backend.ext
+        print(f"({pdf_name}) split into {len(split_pdfs)} PDFs. Converting to {label}...")
+        with self.merger(len(split_pdfs)) as merger:
+            with metrics.Stage("convert", format = ext, document = pdf_name, pages = sum(pages), chunks = len(pages)) as stage:
+                split_outputs = self.convert_pdf_stream(split_pdfs, fingerprints, lambda done, total: progress("convert", done, total), merger, pages, pdf_name)
+                stage.update(bytes_in = metrics.size_of(split_pdfs), bytes_out = metrics.size_of(split_outputs))
+            print(f"({pdf_name})'s splits converted into {label}. Merging into one {label}...")
+            progress("merge")
+            with metrics.Stage("merge", format = ext, document = pdf_name, bytes_in = metrics.size_of(split_outputs)) as stage:
+                if merger:
+                    spire_output = merger.save()
+                else:
+                    spire_output = split_outputs[0] if len(split_outputs) == 1 else self.backend.merge_stream(self.merge_tree(split_outputs))
+                stage.update(bytes_out = len(spire_output))
+        print(f"({pdf_name}) merged. Removing watermarks...")
+        progress("watermarks")
+        output = BytesIO()
+        with metrics.Stage("watermarks", format = ext, document = pdf_name, bytes_in = len(spire_output)) as stage:
+            self.backend.remove_watermarks(BytesIO(spire_output), output)
+            stage.update(bytes_out = metrics.size_of(output))
+        output.seek(0)
+        output = self.optimise(output, pdf_name, progress)
+        print(f"({pdf_name}) converted to {label}!\n")
+        return output
+
+    # the fast path for a PDF of `pages` pages that fits in one split - converted straight to the output format on the worker
+    # pool, by the converter the backend routes it to, then its watermarks removed, without split files, a merge or anything
+    # in the working directory
+    # returns the final file in a BytesIO
+    def convert_single(self, pdf, pdf_name, pages, progress = no_progress):
+        label, ext = self.backend.label, self.backend.ext
+        if isinstance(pdf, str):
+            with open(pdf, "rb") as f:
+                pdf = f.read()
+        print(f"Converting ({pdf_name}) to {label} in one piece...")
+        metrics.annotate_document(pages = pages, chunks = 1)
+        with metrics.Stage("convert", format = ext, document = pdf_name, pages = pages, chunks = 1, bytes_in = len(pdf)) as stage:
+            converter = self.backend.route(pdf)
+            spire_output = run_chunks(self.backend.convert_chunk_stream, {"Single": (pdf, converter)}, self.workers, lambda done, total: progress("convert", done, total),
+                                      pages = {"Single": pages}, converters = {"Single": converter}, format = ext, document = pdf_name)["Single"]
+            stage.update(bytes_out = len(spire_output))
+        progress("watermarks")
+        output = BytesIO()
+        with metrics.Stage("watermarks", format = ext, document = pdf_name, bytes_in = len(spire_output)) as stage:
+            self.backend.remove_watermarks(BytesIO(spire_output), output)
+            stage.update(bytes_out = metrics.size_of(output))
+        output.seek(0)
+        output = self.optimise(output, pdf_name, progress)
+        print(f"({pdf_name}) converted to {label}!\n")
+        return output
+
+    # converting a PDF (a path or its bytes) - only the `pages` picked by a spec such as "1-5,8" when it's given -
+    # straight from the cache when the same pages of the same PDF were converted before
+    # returns a path to the converted file or a BytesIO holding it
+    def convert(self, pdf, pdf_name, progress = no_progress, in_memory = settings.in_memory_pipeline, pages = None):
+        with metrics.job(), metrics.Stage("document", format = self.backend.ext, document = pdf_name, bytes_in = metrics.size_of(pdf)) as stage:
+            total_pages = page_count(pdf)
+            selection = parse_pages(pages, total_pages) if pages else None
+            key = cache_key(pdf, self.backend.ext, selection)
+            cached_path = self.cache.get(key)
+            if cached_path:
+                print(f"({pdf_name}) found in cache")
+                progress("cached")
+                stage.update(cached = True, bytes_out = metrics.size_of(cached_path))
+                return cached_path
+
+            plan = plan_chunks(pdf, total_pages, settings.chunk_pages, self.workers, selection)
+            if settings.fast_path and selection is None and len(plan) == 1:
+                result = self.convert_single(pdf, pdf_name, total_pages, progress)
+            elif in_memory:
+                if isinstance(pdf, str):
+                    with open(pdf, "rb") as f:
+                        pdf = f.read()
+                result = self.convert_bytes(pdf, pdf_name, progress, plan)
+            else:
+                if not isinstance(pdf, str):
+                    # the working-directory pipeline needs the PDF on disk
+                    pdf_path = f"{self.working_dir}/{pdf_name}.pdf"
+                    with open(pdf_path, "wb") as f:
+                        f.write(pdf)
+                    pdf = pdf_path
+                result = self.convert_file(pdf, pdf_name, progress, plan)
+
+            self.cache.put(key, result)
+            stage.update(bytes_out = metrics.size_of(result))
+            return result
+
+    # cache counters for both the whole-document and the chunk cache
+    def cache_summary(self):
+        return {"documents": self.cache.summary(), "chunks": self.chunk_cache.summary()}
+
+# progress of several formats converting at once - `for_format(format)` is the callback for one of them, and their
+# convert stages are reported together, as the splits done out of every format's splits
+def combined_progress(progress):
+    counts, lock = {}, threading.Lock()
+
+    def for_format(fmt):
+        def report(stage, done = None, total = None):
+            if total is None:
+                return progress(stage)
+            with lock:
+                counts[fmt] = (done, total)
+                progress(stage, sum(done for done, _ in counts.values()), sum(total for _, total in counts.values()))
+        return report
+    return for_format
+
+class MultiFormatEngine:
+    """Converts PDFs to several output formats at once - each PDF is split once and every format's splits share the worker pool."""
+
+    def __init__(self, formats, working_dir, cache_dir = None, workers = settings.max_workers):
+        self.engines = {fmt: ConversionEngine(fmt, working_dir, cache_dir, workers) for fmt in formats}
+        self.working_dir = working_dir
+        self.workers = workers
+
+    @property
+    def formats(self):
+        return list(self.engines)
+
+    # these engines keeping document files under `working_dir` instead - the caches are shared
+    def in_workspace(self, working_dir):
+        engine = copy.copy(self)
+        engine.working_dir = working_dir
+        engine.engines = {fmt: format_engine.in_workspace(working_dir) for fmt, format_engine in self.engines.items()}
+        return engine
+
+    # converting a PDF (a path or its bytes) - or only its `pages` - to each of `formats` (every format of this engine by default),
+    # straight from the cache for any format the same pages were converted to before - returns {format: path or BytesIO}
+    def convert(self, pdf, pdf_name, formats = None, progress = no_progress, in_memory = settings.in_memory_pipeline, pages = None):
+        formats = formats or self.formats
+        if len(formats) == 1:
+            return {formats[0]: self.engines[formats[0]].convert(pdf, pdf_name, progress, in_memory, pages)}
+
+        with metrics.job(), metrics.Stage("document", format = ",".join(fmt for fmt in self.formats if fmt in formats), document = pdf_name, bytes_in = metrics.size_of(pdf)) as stage:
+            selection = parse_pages(pages, page_count(pdf)) if pages else None
+            keys = {fmt: cache_key(pdf, self.engines[fmt].backend.ext, selection) for fmt in formats}
+            results = {fmt: cached_path for fmt in formats if (cached_path := self.engines[fmt].cache.get(keys[fmt]))}
+            missing = [fmt for fmt in formats if fmt not in results]
+            if results:
+                print(f"({pdf_name}) found in cache as {', '.join(results)}")
+            if missing:
+                results.update(self.convert_formats(pdf, pdf_name, missing, progress, in_memory, selection))
+                for fmt in missing:
+                    self.engines[fmt].cache.put(keys[fmt], results[fmt])
+            else:
+                progress("cached")
+            stage.update(cached = not missing, bytes_out = metrics.size_of(list(results.values())))
+            return {fmt: results[fmt] for fmt in formats}
+
+    # splitting a PDF once, then converting, merging and removing watermarks for every format at the same time - each format
+    # on a thread of its own, all of them submitting their splits to the one worker pool
+    def convert_formats(self, pdf, pdf_name, formats, progress = no_progress, in_memory = settings.in_memory_pipeline, selection = None):
+        engines = [self.engines[fmt] for fmt in formats]
+        for_format = combined_progress(progress)
+        # planned once, so every format's splits, and the fingerprints its chunk cache is keyed by, cover the same pages
+        total_pages = page_count(pdf)
+        plan = plan_chunks(pdf, total_pages, settings.chunk_pages, self.workers, selection)
+        if settings.fast_path and selection is None and len(plan) == 1:
+            # nothing to split - every format converts the PDF in one piece
+            return self.run_formats({engine.backend.ext: (engine.convert_single, pdf, pdf_name, total_pages, for_format(engine.backend.ext)) for engine in engines})
+
+        if in_memory and isinstance(pdf, str):
+            with open(pdf, "rb") as f:
+                pdf = f.read()
+        elif not in_memory and not isinstance(pdf, str):
+            # the working-directory pipeline needs the PDF on disk
+            pdf_path = f"{self.working_dir}/{pdf_name}.pdf"
+            with open(pdf_path, "wb") as f:
+                f.write(pdf)
+            pdf = pdf_path
+        split = engines[0].split_bytes if in_memory else engines[0].split_file
+        splits, fingerprints, pages = split(pdf, pdf_name, progress, plan)
+
+        tasks = {}
+        for engine in engines:
+            ext = engine.backend.ext
+            convert_splits = engine.convert_split_bytes if in_memory else engine.convert_split_files
+            format_fingerprints = fingerprints if engine is engines[0] else fingerprint_chunks(pdf, plan, ext)
+            tasks[ext] = (convert_splits, splits, format_fingerprints, pages, pdf_name, for_format(ext))
+        results = self.run_formats(tasks)
+
+        if not in_memory:
+            for engine in engines:
+                engine.cleanup(pdf_name)
+        return results # mapping each format to its final file's path, or a BytesIO holding it
+
+    # running each format's `(fn, *args)` on a thread of its own - returns {format: what its fn returned}
+    def run_formats(self, tasks):
+        with ThreadPoolExecutor(max_workers = len(tasks)) as executor:
+            # each thread runs in a copy of this context, so its metrics carry this job and document
+            futures = {fmt: executor.submit(contextvars.copy_context().run, *task) for fmt, task in tasks.items()}
+            return {fmt: future.result() for fmt, future in futures.items()}
+
+    # cache counters as the one format's engine reports them, or per format for several
+    def cache_summary(self):
+        if len(self.engines) == 1:
+            return next(iter(self.engines.values())).cache_summary()
+        return {fmt: engine.cache_summary() for fmt, engine in self.engines.items()}
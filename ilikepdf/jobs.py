@@ -0,0 +1,96 @@
+"""
+background conversion jobs - a bounded queue of documents converted on a small thread pool.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from . import metrics, settings
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while `max_queued` jobs are already waiting or running."""
+
+class JobQueue:
+    """Runs `convert(pdf, pdf_name, progress, **options)` for each submitted job and keeps its status, progress and result."""
+
+    def __init__(self, convert, workers = settings.job_workers, max_queued = settings.max_queued_jobs, ttl = settings.job_ttl,
+                 max_finished = settings.max_finished_jobs):
+        self.convert = convert
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.executor = ThreadPoolExecutor(max_workers = workers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    # queueing a PDF (its bytes or a path) for conversion - returns the new job's id
+    # `cleanup()`, if given, is called once the job has finished with the PDF, and `release()` once the job is dropped
+    # `ticket`, if given, is the job's place in a FairQueue - it waits there for a slot before it runs
+    # `options` are passed on to `convert` and shown in the job's status
+    def submit(self, pdf, pdf_name, cleanup = None, release = None, ticket = None, **options):
+        self.expire()
+        with self.lock:
+            # backpressure - refuse new work once the queue is full instead of letting it grow without bound
+            if sum(job["status"] in ("queued", "running") for job in self.jobs.values()) >= self.max_queued:
+                raise QueueFull(f"{self.max_queued} conversions already in progress, retry later")
+            job = {"id": uuid.uuid4().hex, "pdf_name": pdf_name, "status": "queued", "stage": "queued",
+                   "chunks_done": 0, "chunks_total": None, "submitted": time.time(), "options": options, "release": release}
+            if ticket:
+                job.update(client = ticket.client, priority = ticket.priority)
+            self.jobs[job["id"]] = job
+
+        self.executor.submit(self.run, job, pdf, cleanup, ticket)
+        return job["id"]
+
+    # running one job on a background thread, keeping its status and progress up to date
+    def run(self, job, pdf, cleanup = None, ticket = None):
+        def progress(stage, done = None, total = None):
+            with self.lock:
+                job["stage"] = stage
+                if total is not None:
+                    job["chunks_done"], job["chunks_total"] = done, total
+
+        try:
+            with metrics.job(job["id"]), ticket or nullcontext(): # the job's metrics carry its id
+                with self.lock:
+                    job["status"] = "running"
+                    if ticket:
+                        job["queue_wait_s"] = round(ticket.waited, 3)
+                result = self.convert(pdf, job["pdf_name"], progress, **job["options"])
+            with self.lock:
+                job.update(status = "done", stage = "done", result = result, finished = time.time())
+        except Exception as e:
+            with self.lock:
+                job.update(status = "failed", error = str(e), failed_chunks = getattr(e, "failures", None), finished = time.time())
+        finally:
+            if cleanup:
+                cleanup()
+        self.expire()
+
+    # dropping finished jobs whose results have been kept for longer than ttl, and the oldest beyond `max_finished`
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            finished = sorted((job for job in self.jobs.values() if job.get("finished")), key = lambda job: job["finished"])
+            expired = [job for job in finished if now - job["finished"] > self.ttl]
+            if self.max_finished:
+                expired += finished[len(expired):max(len(expired), len(finished) - self.max_finished)]
+            for job in expired:
+                del self.jobs[job["id"]]
+        for job in expired:
+            if job["release"]:
+                job["release"]()
+
+    # a job's public status (without its result), or None for an unknown job
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else {key: value for key, value in job.items() if key not in ("result", "release")}
+
+    # a finished job's result - a path or a fresh BytesIO, so it can be downloaded more than once - or None once the job is dropped
+    def result(self, job_id):
+        with self.lock:
+            result = self.jobs.get(job_id, {}).get("result")
+        return result if result is None or isinstance(result, str) else type(result)(result.getvalue())
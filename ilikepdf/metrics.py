@@ -0,0 +1,244 @@
+"""
+per-stage instrumentation - wall time, CPU time, peak memory, bytes, pages and chunks for every stage of every document
+and every chunk, written as one JSON log line each and aggregated into histograms for `/metrics` and the bulk summary.
+"""
+
+import bisect
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from . import settings
+from .workers import in_worker, peak_rss_mb, reset_peak_rss, rss_mb
+
+logger = logging.getLogger("ilikepdf.metrics")
+logger.propagate = False
+if settings.metrics_log != "off":
+    handler = logging.StreamHandler(sys.stderr) if settings.metrics_log == "stderr" else logging.FileHandler(settings.metrics_log)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+# the job a record belongs to, set by whoever drives a document (a background job, the bulk loop, one API request)
+current_job = contextvars.ContextVar("current_job", default = None)
+# the document-level stage running in this context, so inner stages can add its pages and chunks
+current_document = contextvars.ContextVar("current_document", default = None)
+# set while running work that isn't real traffic, e.g. warming a server up
+silenced = contextvars.ContextVar("silenced", default = False)
+
+# histogram bucket bounds - seconds for wall and CPU time, MB for memory
+second_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+memory_buckets = (128, 256, 512, 1024, 2048, 4096, 8192)
+
+# size in bytes of a path, bytes, a BytesIO or a list of them
+def size_of(value):
+    if isinstance(value, (list, tuple)):
+        return sum(size_of(item) for item in value)
+    if isinstance(value, str):
+        return os.path.getsize(value) if os.path.exists(value) else 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, "getbuffer"):
+        return value.getbuffer().nbytes
+    return 0
+
+class Histogram:
+    """Cumulative bucket counts, a sum and a count, plus the most recent values for percentiles."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+        self.recent = deque(maxlen = 2048)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, q):
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))] if values else 0
+
+    def state(self):
+        return {"counts": self.counts, "sum": self.sum, "count": self.count, "recent": list(self.recent)}
+
+    def absorb(self, state):
+        self.counts = [a + b for a, b in zip(self.counts, state["counts"])]
+        self.sum += state["sum"]
+        self.count += state["count"]
+        self.recent.extend(state["recent"])
+
+class Registry:
+    """Aggregates stage records per (format, stage, variant) - the converter of a split, the priority of a queued request, else empty."""
+
+    # resident memory as a stage ends, and its peak while the stage ran where that can be measured - in a worker process
+    # running one task at a time, which resets the high-water mark before each task
+    histograms = {"seconds": second_buckets, "cpu_seconds": second_buckets, "rss_end_mb": memory_buckets, "rss_peak_mb": memory_buckets}
+    counters = ("bytes_in", "bytes_out", "pages", "chunks", "errors")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def entry(self, key):
+        if key not in self.stages:
+            self.stages[key] = {"histograms": {name: Histogram(bounds) for name, bounds in self.histograms.items()}, "counters": dict.fromkeys(self.counters, 0)}
+        return self.stages[key]
+
+    def observe(self, record):
+        with self.lock:
+            entry = self.entry((record.get("format") or "", record["stage"], record.get(variants.get(record["stage"], "converter")) or ""))
+            for name, histogram in entry["histograms"].items():
+                if record.get(name) is not None:
+                    histogram.observe(record[name])
+            for name in self.counters:
+                entry["counters"][name] += record.get(name) or 0
+            entry["counters"]["errors"] += record.get("status") == "error"
+
+    # a picklable copy of everything aggregated, for merging another process's registry into this one
+    def snapshot(self):
+        with self.lock:
+            return [(key, {name: histogram.state() for name, histogram in entry["histograms"].items()}, dict(entry["counters"])) for key, entry in self.stages.items()]
+
+    def absorb(self, snapshot):
+        with self.lock:
+            for key, histograms, counters in snapshot:
+                entry = self.entry(tuple(key))
+                for name, state in histograms.items():
+                    entry["histograms"][name].absorb(state)
+                for name, value in counters.items():
+                    entry["counters"][name] += value
+
+    # the Prometheus text format served at /metrics
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, bounds in self.histograms.items():
+                lines += [f"# HELP ilikepdf_stage_{name} {name.replace('_', ' ')} per pipeline stage", f"# TYPE ilikepdf_stage_{name} histogram"]
+                for key, entry in sorted(self.stages.items()):
+                    histogram, labels = entry["histograms"][name], labels_of(key)
+                    cumulative = 0
+                    for bound, count in zip(list(bounds) + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f'ilikepdf_stage_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines += [f"ilikepdf_stage_{name}_sum{{{labels}}} {round(histogram.sum, 6)}", f"ilikepdf_stage_{name}_count{{{labels}}} {histogram.count}"]
+            for name in self.counters:
+                lines += [f"# HELP ilikepdf_stage_{name}_total {name.replace('_', ' ')} per pipeline stage", f"# TYPE ilikepdf_stage_{name}_total counter"]
+                for key, entry in sorted(self.stages.items()):
+                    lines.append(f'ilikepdf_stage_{name}_total{{{labels_of(key)}}} {entry["counters"][name]}')
+        return "\n".join(lines) + "\n"
+
+    # one row per stage (and converter) - count, wall time total/p50/p95/max, CPU time, MB in and out, pages, pages a second and
+    # the most memory a recent stage used (its peak where it was measured, its resident memory at the end otherwise)
+    def table(self):
+        rows = [("stage", "count", "total s", "p50 s", "p95 s", "max s", "cpu s", "MB in", "MB out", "pages", "pages/s", "max RSS MB", "errors")]
+        with self.lock:
+            for key, entry in sorted(self.stages.items(), key = lambda item: (stage_order(item[0][1]), item[0][2])):
+                seconds, counters = entry["histograms"]["seconds"], entry["counters"]
+                rows.append((stage_label(key), seconds.count, f"{seconds.sum:.1f}", f"{seconds.percentile(0.5):.2f}", f"{seconds.percentile(0.95):.2f}",
+                             f"{max(seconds.recent, default = 0):.2f}", f"{entry['histograms']['cpu_seconds'].sum:.1f}",
+                             f"{counters['bytes_in'] / 2**20:.1f}", f"{counters['bytes_out'] / 2**20:.1f}", counters["pages"],
+                             f"{counters['pages'] / seconds.sum:.1f}" if counters["pages"] and seconds.sum else "",
+                             f"{max(entry['histograms']['rss_peak_mb'].recent or entry['histograms']['rss_end_mb'].recent, default = 0):.0f}", counters["errors"]))
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+        return "\n".join("  ".join(str(value).rjust(width) if i else str(value).ljust(width) for i, (value, width) in enumerate(zip(row, widths))) for row in rows)
+
+# the field a stage's records are told apart by besides their format - the converter, unless listed here
+variants = {"queue": "priority"}
+
+# Prometheus labels for a registry key
+def labels_of(key):
+    fmt, stage, variant = key
+    return f'format="{fmt}",stage="{stage}"' + (f',{variants.get(stage, "converter")}="{variant}"' if variant else "")
+
+# a stage's name in tables and benchmark results - `chunk (pdf2docx)` for splits one converter converted, `queue (batch)` for batch requests' waits
+def stage_label(key):
+    _, stage, variant = key
+    return f"{stage} ({variant})" if variant else stage
+
+# stages listed in pipeline order in the summary table
+def stage_order(stage):
+    order = ["queue", "document", "split", "chunk", "convert", "merge", "watermarks", "optimise"]
+    return order.index(stage) if stage in order else len(order)
+
+registry = Registry()
+
+# writing one stage's record to the JSON log and the histograms
+def record(stage, **fields):
+    if silenced.get():
+        return None
+    entry = {"ts": round(time.time(), 3), "stage": stage, "job": current_job.get(), **fields}
+    logger.info(json.dumps(entry, default = str))
+    registry.observe(entry)
+    return entry
+
+class Stage:
+    """Times a stage running in this process - `with Stage("merge", format = "docx") as stage:`, then `stage.update(bytes_out = ...)`."""
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+
+    def update(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        if self.name == "document":
+            self.token = current_document.set(self)
+        self.wall, self.cpu, self.rss = time.perf_counter(), time.thread_time(), rss_mb()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.name == "document":
+            current_document.reset(self.token)
+        # resident memory at the start and end only - other threads share the process, so its high-water mark isn't this stage's
+        record(self.name, seconds = round(time.perf_counter() - self.wall, 4), cpu_seconds = round(time.thread_time() - self.cpu, 4),
+               rss_start_mb = round(self.rss), rss_end_mb = round(rss_mb()), status = "error" if exc_type else "ok", **({"error": str(exc)} if exc else {}), **self.fields)
+
+# running the enclosed stages as one job - `job_id`, the job already running in this context, or a new id
+@contextmanager
+def job(job_id = None):
+    token = current_job.set(job_id or current_job.get() or uuid.uuid4().hex)
+    try:
+        yield current_job.get()
+    finally:
+        current_job.reset(token)
+
+# recording nothing from the enclosed stages
+@contextmanager
+def muted():
+    token = silenced.set(True)
+    try:
+        yield
+    finally:
+        silenced.reset(token)
+
+# adding pages, chunks and the like to the document being converted in this context
+def annotate_document(**fields):
+    document = current_document.get()
+    if document is not None:
+        document.update(**fields)
+
+# running `fn(*args)` - typically inside a worker process - and measuring it there; in a pool worker, which runs one task
+# at a time, its peak memory is measured from a high-water mark reset just before it starts, where the platform allows that
+# returns (ok, result or error message, measurements), so a failure still reports how long it took
+def timed_call(fn, *args):
+    peak_reset, rss = in_worker() and reset_peak_rss(), rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        ok, value = True, fn(*args)
+    except Exception as e:
+        ok, value = False, str(e)
+    measured = {"seconds": round(time.perf_counter() - wall, 4), "cpu_seconds": round(time.process_time() - cpu, 4), "rss_start_mb": round(rss), "rss_end_mb": round(rss_mb())}
+    if peak_reset:
+        measured["rss_peak_mb"] = round(peak_rss_mb())
+    return ok, value, measured
@@ -0,0 +1,371 @@
+"""
+OOXML-level merging - appends converted splits by copying parts between their zip packages with lxml,
+instead of loading every split into Spire's object model only to write it back out.
+parts that are identical across splits (media, fonts, slide masters with their layouts and theme) are stored once.
+"""
+
+import hashlib
+import posixpath
+import re
+import zipfile
+from io import BytesIO
+from lxml import etree
+
+CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+WP_NS = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+P_NS = "http://schemas.openxmlformats.org/presentationml/2006/main"
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+RT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/" # prefix of every part relationship type
+
+def w(tag):
+    return f"{{{W_NS}}}{tag}"
+
+def p(tag):
+    return f"{{{P_NS}}}{tag}"
+
+class Package:
+    """An OOXML package held in memory - its parts by name (without the leading slash), content types and relationships."""
+
+    def __init__(self, source):
+        with zipfile.ZipFile(source) as z:
+            self.parts = {name: z.read(name) for name in z.namelist() if not name.endswith("/")}
+        types = etree.fromstring(self.parts.pop("[Content_Types].xml"))
+        self.defaults = {el.get("Extension").lower(): el.get("ContentType") for el in types.iter(f"{{{CT_NS}}}Default")}
+        self.overrides = {el.get("PartName").lstrip("/"): el.get("ContentType") for el in types.iter(f"{{{CT_NS}}}Override")}
+        self.xml = {} # parts parsed for editing, serialised again on save
+        self.counters = {}
+
+    def content_type(self, name):
+        return self.overrides.get(name) or self.defaults.get(posixpath.splitext(name)[1][1:].lower())
+
+    # a part's parsed XML - changes to it are saved with the package
+    def element(self, name):
+        if name not in self.xml:
+            self.xml[name] = etree.fromstring(self.parts[name])
+        return self.xml[name]
+
+    def data(self, name):
+        if name in self.xml:
+            return etree.tostring(self.xml[name], xml_declaration = True, encoding = "UTF-8", standalone = True)
+        return self.parts[name]
+
+    @staticmethod
+    def rels_name(name):
+        directory, base = posixpath.split(name)
+        return posixpath.join(directory, "_rels", f"{base}.rels")
+
+    # a part's relationships: rId -> (type, target part name or external URL, whether it's external)
+    def rels(self, name):
+        if self.rels_name(name) not in self.parts:
+            return {}
+        rels = {}
+        for rel in self.element(self.rels_name(name)):
+            external = rel.get("TargetMode") == "External"
+            target = rel.get("Target") if external else posixpath.normpath(posixpath.join(posixpath.dirname(name), rel.get("Target"))).lstrip("/")
+            rels[rel.get("Id")] = (rel.get("Type"), target, external)
+        return rels
+
+    # adding a relationship from part `source` to `target` (a part name or an external URL), returning its rId
+    def relate(self, source, rel_type, target, external = False, rid = None):
+        rels_name = self.rels_name(source)
+        if rels_name not in self.parts:
+            self.parts[rels_name] = f'<Relationships xmlns="{RELS_NS}"/>'.encode()
+        root = self.element(rels_name)
+        if rid is None:
+            ids, n = {rel.get("Id") for rel in root}, len(root) + 1
+            while f"rId{n}" in ids:
+                n += 1
+            rid = f"rId{n}"
+        attrib = {"Id": rid, "Type": rel_type, "Target": target if external else posixpath.relpath(target, posixpath.dirname(source) or ".")}
+        if external:
+            attrib["TargetMode"] = "External"
+        etree.SubElement(root, f"{{{RELS_NS}}}Relationship", attrib)
+        return rid
+
+    def add(self, name, data, content_type):
+        self.parts[name] = data
+        if self.defaults.get(posixpath.splitext(name)[1][1:].lower()) != content_type:
+            self.overrides[name] = content_type
+
+    # an unused part name in the numbering of `name`, e.g. ppt/slides/slide4.xml for ppt/slides/slide1.xml
+    def unused_name(self, name):
+        template = re.sub(r"\d*(\.[^./]+)$", r"{}\1", name)
+        n = self.counters.get(template, 1)
+        while template.format(n) in self.parts:
+            n += 1
+        self.counters[template] = n + 1
+        return template.format(n)
+
+    # pointing every relationship that targets a part in `renamed` (old name -> new name) at the new name
+    def retarget(self, renamed):
+        for rels_name in [name for name in self.parts if name.endswith(".rels")]:
+            directory, base = posixpath.split(rels_name)
+            source = posixpath.join(posixpath.dirname(directory), base[:-len(".rels")])
+            for rel in self.element(rels_name):
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(source), rel.get("Target"))).lstrip("/")
+                if rel.get("TargetMode") != "External" and target in renamed:
+                    rel.set("Target", posixpath.relpath(renamed[target], posixpath.dirname(source) or "."))
+
+    # folding parts with the same content type and bytes, and no relationships of their own, into one - every relationship
+    # is pointed at the part kept, and `by_hash` collects (content type, sha256) -> kept part for later lookups
+    # returns each removed part's name and size
+    def deduplicate(self, by_hash = None):
+        by_hash, duplicates = {} if by_hash is None else by_hash, {}
+        for name in list(self.parts):
+            if not name.endswith(".rels") and not self.rels(name):
+                key = (self.content_type(name), hashlib.sha256(self.parts[name]).hexdigest())
+                if key in by_hash:
+                    duplicates[name] = by_hash[key]
+                else:
+                    by_hash[key] = name
+        if duplicates:
+            self.retarget(duplicates)
+        return {name: len(self.parts.pop(name)) for name in duplicates}
+
+    # writing the package as a zip to a path or file-like object, one part at a time - deflated at `compresslevel` when
+    # it's given, with PNG and JPEG images, which are compressed already, stored as they are
+    def save(self, output, compresslevel = None):
+        types = etree.Element(f"{{{CT_NS}}}Types", nsmap = {None: CT_NS})
+        for extension, content_type in self.defaults.items():
+            etree.SubElement(types, f"{{{CT_NS}}}Default", Extension = extension, ContentType = content_type)
+        for name, content_type in self.overrides.items():
+            if name in self.parts:
+                etree.SubElement(types, f"{{{CT_NS}}}Override", PartName = f"/{name}", ContentType = content_type)
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED, compresslevel = compresslevel) as z:
+            z.writestr("[Content_Types].xml", etree.tostring(types, xml_declaration = True, encoding = "UTF-8", standalone = True))
+            for name in self.parts:
+                stored = compresslevel is not None and self.content_type(name) in ("image/png", "image/jpeg")
+                z.writestr(name, self.data(name), zipfile.ZIP_STORED if stored else None)
+
+# hash of an XML part that ignores Spire's run-to-run reordering of theme font lists, so identical themes hash the same
+def canonical_hash(data):
+    root = etree.fromstring(data)
+    for font_list in root.iter(f"{{{A_NS}}}majorFont", f"{{{A_NS}}}minorFont"):
+        fonts = [child for child in font_list if child.tag == f"{{{A_NS}}}font"]
+        for font in fonts:
+            font_list.remove(font)
+        font_list.extend(sorted(fonts, key = lambda font: font.get("script", "")))
+    return hashlib.sha256(etree.tostring(root, method = "c14n")).hexdigest()
+
+class PackageMerger:
+    """Shared by the DOCX and PPTX mergers - the first split becomes the merged package and later splits' parts are copied into it."""
+
+    def __init__(self):
+        self.package = None
+        self.by_hash = {} # (content type, sha256) -> merged part, for parts without relationships of their own
+        self.stats = {"parts_deduplicated": 0, "bytes_deduplicated": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.package = None
+
+    @staticmethod
+    def load(split):
+        return Package(split if isinstance(split, str) else BytesIO(split))
+
+    # remembering the merged package's parts by content, so identical parts of later splits aren't copied again
+    # - parts repeated within the first split itself (Spire saves an image once per use) are folded into one
+    def index(self):
+        for size in self.package.deduplicate(self.by_hash).values():
+            self.stats["parts_deduplicated"] += 1
+            self.stats["bytes_deduplicated"] += size
+
+    # copying part `name` of `source`, and every part it relates to, into the merged package - returns its name there
+    # `copied` maps the split's part names already copied (or matched) to their merged names
+    def copy_part(self, source, name, copied):
+        if name in copied:
+            return copied[name]
+        data, content_type, rels = source.data(name), source.content_type(name), source.rels(name)
+        if not rels:
+            key = (content_type, hashlib.sha256(data).hexdigest())
+            if key in self.by_hash:
+                self.stats["parts_deduplicated"] += 1
+                self.stats["bytes_deduplicated"] += len(data)
+                copied[name] = self.by_hash[key]
+                return copied[name]
+        copied[name] = self.package.unused_name(name)
+        self.package.add(copied[name], data, content_type)
+        if not rels:
+            self.by_hash[key] = copied[name]
+        # the copy keeps its rIds, so its XML needs no rewriting - only its relationships point at the copied targets
+        for rid, (rel_type, target, external) in rels.items():
+            self.package.relate(copied[name], rel_type, target if external else self.copy_part(source, target, copied), external, rid)
+        return copied[name]
+
+    # saving the merged package to `output_path`, or returning its bytes without one
+    def save(self, output_path = None):
+        if output_path:
+            self.package.save(output_path)
+            return output_path
+        output = BytesIO()
+        self.package.save(output)
+        return output.getvalue()
+
+class DocxPackageMerger(PackageMerger):
+    """Appends each split's document body, with a section break carrying the previous split's page setup, and the parts it refers to."""
+
+    document = "word/document.xml"
+
+    def append(self, split):
+        if self.package is None:
+            self.package = self.load(split)
+            self.index()
+            return
+        source, copied = self.load(split), {}
+        body = self.package.element(self.document).find(w("body"))
+        content = list(source.element(self.document).find(w("body")))
+
+        # the merged body's final sectPr moves into a paragraph of its own - a section break - and the split's takes its place
+        last_section = body[-1] if len(body) and body[-1].tag == w("sectPr") else None
+        if last_section is not None:
+            etree.SubElement(etree.SubElement(body, w("p")), w("pPr")).append(last_section)
+
+        self.merge_numbering(source, content)
+        self.merge_definitions(source, "fontTable", w("font"), w("name"), copied)
+        self.merge_definitions(source, "styles", w("style"), w("styleId"), copied)
+
+        # relationships used by the content (images, hyperlinks, headers...) are copied across and renamed
+        rels, rids = source.rels(self.document), {}
+        next_id = max([int(el.get("id")) for el in body.iter(f"{{{WP_NS}}}docPr") if el.get("id", "").isdigit()] + [0]) + 1
+        for element in content:
+            for el in element.iter():
+                for attr, rid in el.attrib.items():
+                    if attr.startswith(f"{{{R_NS}}}") and rid in rels:
+                        if rid not in rids:
+                            rel_type, target, external = rels[rid]
+                            rids[rid] = self.package.relate(self.document, rel_type, target if external else self.copy_part(source, target, copied), external)
+                        el.set(attr, rids[rid])
+                if el.tag == f"{{{WP_NS}}}docPr": # drawing ids have to stay unique across the document
+                    el.set("id", str(next_id))
+                    next_id += 1
+            body.append(element)
+
+    # appending the font or style definitions (`tag`, identified by `key`) of a split that the merged document doesn't have yet
+    def merge_definitions(self, source, rel_type, tag, key, copied):
+        source_part = next((target for t, target, _ in source.rels(self.document).values() if t == RT + rel_type), None)
+        if source_part is None:
+            return
+        merged_part = next((target for t, target, _ in self.package.rels(self.document).values() if t == RT + rel_type), None)
+        if merged_part is None:
+            self.package.relate(self.document, RT + rel_type, self.copy_part(source, source_part, copied))
+            return
+        merged_root, source_rels = self.package.element(merged_part), source.rels(source_part)
+        known = {el.get(key) for el in merged_root.iter(tag)}
+        for el in list(source.element(source_part).iter(tag)):
+            if el.get(key) in known:
+                continue
+            # embedded fonts refer to their font files through the font table's own relationships
+            for child in el.iter():
+                for attr, rid in child.attrib.items():
+                    if attr.startswith(f"{{{R_NS}}}") and rid in source_rels:
+                        rel_type_, target, external = source_rels[rid]
+                        child.set(attr, self.package.relate(merged_part, rel_type_, target if external else self.copy_part(source, target, copied), external))
+            merged_root.append(el)
+
+    # appending a split's list definitions under new ids, and pointing its paragraphs at them
+    def merge_numbering(self, source, content):
+        source_part = next((target for t, target, _ in source.rels(self.document).values() if t == RT + "numbering"), None)
+        if source_part is None:
+            return
+        merged_part = next((target for t, target, _ in self.package.rels(self.document).values() if t == RT + "numbering"), None)
+        if merged_part is None:
+            merged_part = "word/numbering.xml"
+            self.package.add(merged_part, f'<w:numbering xmlns:w="{W_NS}"/>'.encode(), source.content_type(source_part))
+            self.package.relate(self.document, RT + "numbering", merged_part)
+        merged_root = self.package.element(merged_part)
+        abstract_offset = max([int(el.get(w("abstractNumId"))) for el in merged_root.iter(w("abstractNum"))] + [-1]) + 1
+        num_offset = max([int(el.get(w("numId"))) for el in merged_root.iter(w("num"))] + [0])
+
+        first_num = merged_root.find(w("num")) # abstract definitions have to come before every num
+        for el in list(source.element(source_part).iter(w("abstractNum"))):
+            el.set(w("abstractNumId"), str(int(el.get(w("abstractNumId"))) + abstract_offset))
+            first_num.addprevious(el) if first_num is not None else merged_root.append(el)
+        for el in list(source.element(source_part).iter(w("num"))):
+            el.set(w("numId"), str(int(el.get(w("numId"))) + num_offset))
+            abstract = el.find(w("abstractNumId"))
+            abstract.set(w("val"), str(int(abstract.get(w("val"))) + abstract_offset))
+            merged_root.append(el)
+        for element in content:
+            for num_id in element.iter(w("numId")):
+                if num_id.get(w("val")) != "0": # 0 means "no list"
+                    num_id.set(w("val"), str(int(num_id.get(w("val"))) + num_offset))
+
+class PptxPackageMerger(PackageMerger):
+    """Appends each split's slides in order, reusing a slide master (with its layouts and theme) already in the merged deck when it's identical."""
+
+    presentation = "ppt/presentation.xml"
+
+    def append(self, split):
+        if self.package is None:
+            self.package = self.load(split)
+            self.index()
+            self.masters = {self.master_hash(self.package, master): master for master in self.targets(self.package, "slideMaster")}
+            return
+        source, copied = self.load(split), {}
+
+        # matching the split's masters to identical ones already merged - their layouts and theme are matched in order
+        for master in self.targets(source, "slideMaster"):
+            merged_master = self.masters.get(self.master_hash(source, master))
+            if merged_master:
+                copied[master] = merged_master
+                for (_, target, _), (_, merged_target, _) in zip(self.family(source, master), self.family(self.package, merged_master)):
+                    copied[target] = merged_target
+                    self.stats["parts_deduplicated"] += 1
+                    self.stats["bytes_deduplicated"] += len(source.data(target))
+                self.stats["parts_deduplicated"] += 1
+                self.stats["bytes_deduplicated"] += len(source.data(master))
+            else:
+                self.add_master(source, master, copied)
+
+        pres = self.package.element(self.presentation)
+        slide_ids = pres.find(p("sldIdLst"))
+        if slide_ids is None:
+            slide_ids = etree.SubElement(pres, p("sldIdLst"))
+            pres.find(p("sldMasterIdLst")).addnext(slide_ids)
+        next_id = max([int(el.get("id")) for el in slide_ids] + [255]) + 1
+        for slide in self.targets(source, "slide"):
+            rid = self.package.relate(self.presentation, RT + "slide", self.copy_part(source, slide, copied))
+            etree.SubElement(slide_ids, p("sldId"), {"id": str(next_id), f"{{{R_NS}}}id": rid})
+            next_id += 1
+
+    # the presentation's targets of one relationship type, in the order the presentation lists them
+    @staticmethod
+    def targets(package, rel_type):
+        rels = package.rels(PptxPackageMerger.presentation)
+        list_tag = {"slide": p("sldIdLst"), "slideMaster": p("sldMasterIdLst")}[rel_type]
+        id_list = package.element(PptxPackageMerger.presentation).find(list_tag)
+        return [rels[el.get(f"{{{R_NS}}}id")][1] for el in (id_list if id_list is not None else [])]
+
+    # a master's layouts (in the order it lists them) and theme
+    @staticmethod
+    def family(package, master):
+        rels = package.rels(master)
+        layouts = package.element(master).find(p("sldLayoutIdLst"))
+        family = [rels[el.get(f"{{{R_NS}}}id")] for el in (layouts if layouts is not None else [])]
+        return family + [rel for rel in rels.values() if rel[0] == RT + "theme"]
+
+    def master_hash(self, package, master):
+        hashes = [canonical_hash(package.data(master))] + [canonical_hash(package.data(target)) for _, target, _ in self.family(package, master)]
+        return hashlib.sha256("".join(hashes).encode()).hexdigest()
+
+    # copying a master that isn't in the merged deck yet, with ids for it and its layouts that don't clash with any already there
+    def add_master(self, source, master, copied):
+        merged_master = self.copy_part(source, master, copied)
+        pres = self.package.element(self.presentation)
+        masters = pres.find(p("sldMasterIdLst"))
+        used = [int(el.get("id")) for el in masters]
+        for merged in self.targets(self.package, "slideMaster"):
+            layouts = self.package.element(merged).find(p("sldLayoutIdLst"))
+            used += [int(el.get("id")) for el in (layouts if layouts is not None else [])]
+        next_id = max(used + [2147483647]) + 1
+        rid = self.package.relate(self.presentation, RT + "slideMaster", merged_master)
+        etree.SubElement(masters, p("sldMasterId"), {"id": str(next_id), f"{{{R_NS}}}id": rid})
+        layouts = self.package.element(merged_master).find(p("sldLayoutIdLst"))
+        for offset, el in enumerate(layouts if layouts is not None else [], 1):
+            el.set("id", str(next_id + offset))
+        self.masters[self.master_hash(source, master)] = merged_master
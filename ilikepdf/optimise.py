@@ -0,0 +1,120 @@
+"""
+shrinking a converted DOCX/PPTX - Spire embeds every image as a full-resolution PNG, often the same one many times over.
+images larger than they're shown are downsampled to a target DPI and re-encoded as whichever of PNG and JPEG is smallest,
+identical media parts are stored once, and the package is written back at the highest zip compression.
+"""
+
+import posixpath
+from io import BytesIO
+from lxml import etree
+from PIL import Image
+from . import settings
+from .ooxml import A_NS, R_NS, WP_NS, Package
+
+EMU_PER_INCH = 914400
+# raster images that are re-encoded - anything else (EMF, WMF, SVG, GIF) is left as it is
+raster_types = ("image/png", "image/jpeg", "image/bmp", "image/tiff")
+# Pillow formats each image is re-encoded to, with the extension and content type of the part holding it
+encodings = {"PNG": ("png", "image/png"), "JPEG": ("jpeg", "image/jpeg")}
+
+# the size a picture is shown at, in EMU - the extent of the nearest drawing or shape around its blip, or None (e.g. for a background)
+def shown_extent(blip):
+    for ancestor in blip.iterancestors():
+        extent = ancestor.find(f"{{{WP_NS}}}extent")
+        if extent is None:
+            extent = ancestor.find(f"*/{{{A_NS}}}xfrm/{{{A_NS}}}ext")
+        if extent is not None:
+            return int(extent.get("cx", 0)), int(extent.get("cy", 0))
+    return None
+
+# the largest size, in inches, each image part is shown at anywhere in the package - None for images also shown
+# somewhere without a size of their own, which are never downsampled
+def shown_sizes(package):
+    sizes = {}
+    for name in list(package.parts):
+        if not name.endswith(".xml") or b"blip" not in package.parts[name]:
+            continue
+        rels = package.rels(name)
+        for blip in etree.fromstring(package.data(name)).iter(f"{{{A_NS}}}blip"):
+            rid = blip.get(f"{{{R_NS}}}embed")
+            if rid not in rels or rels[rid][2]:
+                continue
+            target, extent = rels[rid][1], shown_extent(blip)
+            if not extent or not all(extent) or (target in sizes and sizes[target] is None):
+                sizes[target] = None
+                continue
+            # a cropped picture shows only part of its image, which is scaled up to fill the extent
+            crop = blip.getparent().find(f"{{{A_NS}}}srcRect")
+            crop = {side: int(crop.get(side, 0)) / 100000 for side in "ltrb"} if crop is not None else dict.fromkeys("ltrb", 0)
+            width = extent[0] / EMU_PER_INCH / max(1 - crop["l"] - crop["r"], 0.01)
+            height = extent[1] / EMU_PER_INCH / max(1 - crop["t"] - crop["b"], 0.01)
+            shown = sizes.get(target, (0, 0))
+            sizes[target] = (max(shown[0], width), max(shown[1], height))
+    return sizes
+
+# re-encoding one image - downsampled to `dpi` at its `shown` size (inches) when it's noticeably larger, then saved as the
+# smallest of PNG and, for opaque images with a `quality` above 0, JPEG
+# returns (data, Pillow format, whether it was downsampled), or None when nothing beats the original
+def reencode(data, shown, dpi, quality):
+    image = Image.open(BytesIO(data))
+    if getattr(image, "n_frames", 1) > 1 or image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA", "CMYK"):
+        return None
+    image.load()
+
+    downsampled = False
+    if shown and dpi:
+        scale = max(shown[0] * dpi / image.width, shown[1] * dpi / image.height)
+        if scale < 0.9:
+            image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+            downsampled = True
+
+    if image.mode == "P":
+        opaque = "transparency" not in image.info
+    elif image.mode in ("LA", "RGBA"):
+        opaque = image.getchannel("A").getextrema()[0] == 255
+        if opaque: # an alpha channel that hides nothing is dropped
+            image = image.convert(image.mode[:-1])
+    else:
+        opaque = True
+
+    candidates = []
+    png = BytesIO()
+    (image.convert("RGB") if image.mode == "CMYK" else image).save(png, "PNG", optimize = True)
+    candidates.append((png.getvalue(), "PNG"))
+    if opaque and quality:
+        jpeg = BytesIO()
+        image.convert("L" if image.mode in ("1", "L") else "RGB").save(jpeg, "JPEG", quality = quality, optimize = True)
+        candidates.append((jpeg.getvalue(), "JPEG"))
+    best, encoding = min(candidates, key = lambda candidate: len(candidate[0]))
+    return (best, encoding, downsampled) if len(best) < len(data) else None
+
+# optimising a DOCX/PPTX (a path or file-like object) into `output` (a path, which may be the source's own, or a file-like object)
+# returns what was done - images downsampled and re-encoded, and duplicate media parts removed
+def optimise_package(source, output, dpi = settings.optimise_dpi, quality = settings.optimise_jpeg_quality):
+    package = Package(source)
+    stats = {"images_downsampled": 0, "images_reencoded": 0, "parts_deduplicated": len(package.deduplicate())}
+
+    sizes, renamed = shown_sizes(package), {}
+    for name in [name for name in package.parts if package.content_type(name) in raster_types]:
+        try:
+            result = reencode(package.parts[name], sizes.get(name), dpi, quality)
+        except Exception: # an image Pillow can't read is kept as it is
+            result = None
+        if result is None:
+            continue
+        data, encoding, downsampled = result
+        stats["images_downsampled"] += downsampled
+        stats["images_reencoded"] += 1
+        ext, content_type = encodings[encoding]
+        if content_type == package.content_type(name):
+            package.parts[name] = data
+        else:
+            # a PNG saved as JPEG moves to a part with the right extension, and everything pointing at it follows
+            del package.parts[name]
+            renamed[name] = package.unused_name(f"{posixpath.splitext(name)[0]}.{ext}")
+            package.add(renamed[name], data, content_type)
+    if renamed:
+        package.retarget(renamed)
+
+    package.save(output, compresslevel = 9)
+    return stats
@@ -0,0 +1,224 @@
+"""
+two-level scheduling for bulk runs - one process pool shared by every queued document and fed at chunk granularity,
+so a few huge PDFs and many small ones keep every core busy until the very end of the batch.
+"""
+
+import heapq
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from . import metrics, settings
+from .cache import cache_key
+from .chunking import page_count, parse_pages
+from .engine import ConversionEngine
+from .workers import WorkerPool
+
+### worker-side tasks - module-level so the pool can pickle them, each worker keeping one engine per format
+_engines = {}
+
+def get_engine(output_format, output_dir):
+    if (output_format, output_dir) not in _engines:
+        _engines[(output_format, output_dir)] = ConversionEngine(output_format, output_dir)
+    return _engines[(output_format, output_dir)]
+
+# step 1 - splitting one document (only its `selection` of pages, when there is one), planned as if it had the whole pool to itself
+def split_task(output_format, output_dir, pdf_path, pdf_name, selection = None):
+    return get_engine(output_format, output_dir).split_pdf(pdf_path, pdf_name, selection = selection)
+
+# step 2 - converting one split of one document with the converter it was routed to
+def convert_task(output_format, output_dir, split_pdf_path, output_path, converter = "spire"):
+    return get_engine(output_format, output_dir).backend.convert_chunk(split_pdf_path, output_path, converter)
+
+# steps 3 to 5 - merging one document's converted splits, in page order, removing the watermarks and optimising the result
+# a tree merge runs its levels one after another here - pool workers can't start processes of their own
+def merge_task(output_format, output_dir, pdf_name, split_output_paths):
+    engine = get_engine(output_format, output_dir)
+    spire_path = engine.merge(split_output_paths, pdf_name, workers = 1)
+    output_path = engine.optimise(engine.remove_watermarks(spire_path, pdf_name), pdf_name)
+    engine.cleanup(pdf_name)
+    return output_path
+
+class ChunkScheduler:
+    """Converts many documents on one pool: merges first, then the largest ready chunks, splitting more documents as chunks run low."""
+
+    def __init__(self, output_format, output_dir, workers = settings.max_workers, timeout = None, on_status = None, pages = None):
+        self.output_format = output_format
+        self.output_dir = output_dir
+        self.workers = workers
+        self.timeout = timeout
+        self.pages = pages # a spec such as "1-5,8" picking the pages converted from every document, every page when None
+        # on_status(pdf, status, **details) is called when a document starts ("in_progress") and when it is "done" or "failed"
+        self.on_status = on_status or (lambda pdf, status, **details: None)
+        self.engine = ConversionEngine(output_format, output_dir, workers = workers) # the caches are only used from this process
+        self.pool = None
+
+    # converting `documents`, a list of (pdf, pdf_path, pdf_name)
+    def run(self, documents):
+        ext = self.engine.backend.ext
+        self.pool = WorkerPool(self.workers)
+        self.seq = 0 # tie-breaker keeping heap order stable
+        self.splits, self.chunks, self.merges = [], [], []
+        self.in_flight = {} # future -> (kind, document, details)
+        self.active = [] # documents split or being split, not finished yet
+
+        for pdf, pdf_path, pdf_name in documents:
+            document = {"pdf": pdf, "pdf_path": pdf_path, "pdf_name": pdf_name, "selection": None, "pending": 0, "failures": {}, "fingerprints": {}, "outputs": [], "pages": {}, "started": None, "finished": False,
+                        "cpu_seconds": 0, "rss_peak_mb": 0}
+            try:
+                document["selection"] = parse_pages(self.pages, page_count(pdf_path)) if self.pages else None
+            except Exception as e: # pages past the end of this document, or a PDF that can't be read
+                document["started"] = time.time()
+                self.finish(document, "failed", error = str(e))
+                continue
+            document["key"] = cache_key(pdf_path, ext, document["selection"])
+            # a PDF converted before is copied straight out of the cache
+            cached_path = self.engine.cache.get(document["key"])
+            if cached_path:
+                os.makedirs(f"{self.output_dir}/{pdf_name}", exist_ok = True)
+                shutil.copyfile(cached_path, f"{self.output_dir}/{pdf_name}/{pdf_name}.{ext}")
+                document["started"] = time.time()
+                self.finish(document, "done", cached = True)
+                continue
+            # largest documents are split first, so their chunks are in the queue early
+            self.push(self.splits, -os.path.getsize(pdf_path), document)
+
+        try:
+            while self.splits or self.chunks or self.merges or self.in_flight:
+                self.fill()
+                done, _ = wait(list(self.in_flight), timeout = self.next_deadline(), return_when = FIRST_COMPLETED)
+                for future in done:
+                    self.collect(future)
+                self.expire()
+        finally:
+            self.pool.shutdown(wait = False, cancel_futures = True)
+            stats = self.pool.stats
+            print(f"Workers ran {stats['tasks']} tasks - {stats['recycled']} recycled, {stats['crashed']} crashed, {stats['killed']} killed, peak memory {stats['peak_rss_mb']} MB")
+
+    def push(self, heap, priority, document, *args):
+        self.seq += 1
+        heapq.heappush(heap, (priority, self.seq, document, args))
+
+    # picking the next task: merges finish documents, splits only run when chunks are running low, otherwise largest chunk first
+    def next_task(self):
+        while self.merges or self.splits or self.chunks:
+            if self.merges:
+                heap, kind = self.merges, "merge"
+            elif self.splits and (len(self.chunks) < 2 * self.workers or not self.chunks):
+                heap, kind = self.splits, "split"
+            else:
+                heap, kind = self.chunks, "convert"
+            _, _, document, args = heapq.heappop(heap)
+            if not document["finished"]: # tasks of documents that already failed or timed out are dropped
+                return kind, document, args
+        return None
+
+    # keeping every worker busy
+    def fill(self):
+        while len(self.in_flight) < self.workers:
+            task = self.next_task()
+            if task is None:
+                return
+            kind, document, args = task
+            if kind == "split":
+                document["started"] = time.time()
+                self.active.append(document)
+                self.on_status(document["pdf"], "in_progress")
+                future = self.pool.submit(metrics.timed_call, split_task, self.output_format, self.output_dir, document["pdf_path"], document["pdf_name"], document["selection"])
+            elif kind == "convert":
+                future = self.pool.submit(metrics.timed_call, convert_task, self.output_format, self.output_dir, *args[1:])
+            else:
+                future = self.pool.submit(metrics.timed_call, merge_task, self.output_format, self.output_dir, document["pdf_name"], document["outputs"])
+            self.in_flight[future] = (kind, document, args)
+
+    # handling a finished task - queueing the chunks of a split document, or the merge of a fully converted one
+    def collect(self, future):
+        kind, document, args = self.in_flight.pop(future)
+        try:
+            ok, value, measured = future.result() # measured in the worker that ran the task
+        except Exception as e: # the worker died
+            ok, value, measured = False, str(e), {}
+        result, error = (value, None) if ok else (None, value)
+        document["cpu_seconds"] += measured.get("cpu_seconds", 0)
+        document["rss_peak_mb"] = max(document["rss_peak_mb"], measured.get("rss_peak_mb") or measured.get("rss_end_mb", 0))
+        if document["finished"]:
+            return
+
+        ext = self.engine.backend.ext
+        fields = {"format": ext, "document": document["pdf_name"], "status": "ok" if ok else "error", **measured, **({"error": error} if error else {})}
+        if kind == "split":
+            if error:
+                metrics.record("split", bytes_in = metrics.size_of(document["pdf_path"]), **fields)
+                return self.finish(document, "failed", error = error)
+            split_pdf_paths, fingerprints = result
+            pages = [page_count(split_pdf_path) for split_pdf_path in split_pdf_paths]
+            metrics.record("split", pages = sum(pages), chunks = len(pages), bytes_in = metrics.size_of(document["pdf_path"]), bytes_out = metrics.size_of(split_pdf_paths), **fields)
+            split_output_dir = f"{self.output_dir}/{document['pdf_name']}/split_{ext}s"
+            os.makedirs(split_output_dir, exist_ok = True)
+            for split_pdf_path, fingerprint, split_pages in zip(split_pdf_paths, fingerprints, pages):
+                split_name = os.path.basename(split_pdf_path).rsplit(".", 1)[0]
+                document["fingerprints"][split_name] = fingerprint
+                document["pages"][split_name] = split_pages
+                document["outputs"].append(f"{split_output_dir}/{split_name}.{ext}")
+                cached_path = self.engine.chunk_cache.get(fingerprint)
+                if cached_path:
+                    shutil.copyfile(cached_path, document["outputs"][-1])
+                    continue
+                # bigger split files take longer to convert - running them first keeps the tail of the batch short
+                self.push(self.chunks, -os.path.getsize(split_pdf_path), document, split_name, split_pdf_path, document["outputs"][-1], self.engine.backend.route(split_pdf_path))
+                document["pending"] += 1
+        elif kind == "convert":
+            split_name, split_pdf_path, output_path, converter = args
+            metrics.record("chunk", chunk = split_name, pages = document["pages"][split_name], converter = converter, bytes_in = metrics.size_of(split_pdf_path),
+                           bytes_out = metrics.size_of(output_path) if ok else 0, **fields)
+            document["pending"] -= 1
+            if error:
+                document["failures"][split_name] = error
+            else:
+                self.engine.chunk_cache.put(document["fingerprints"].get(split_name), output_path)
+        else:
+            # the merge task removes the watermarks and optimises the result too
+            metrics.record("merge", bytes_in = metrics.size_of(document["outputs"]), bytes_out = metrics.size_of(result) if ok else 0, **fields)
+            if error:
+                return self.finish(document, "failed", error = error)
+            self.engine.cache.put(document["key"], result)
+            return self.finish(document, "done")
+
+        # every chunk of the document is accounted for
+        if document["pending"] == 0:
+            if document["failures"]:
+                self.finish(document, "failed", error = "failed to convert " + ", ".join(sorted(document["failures"])), failed_chunks = document["failures"])
+            else:
+                self.push(self.merges, 0, document)
+
+    def finish(self, document, status, **details):
+        document["finished"] = True
+        if document in self.active:
+            self.active.remove(document)
+        seconds = round(time.time() - document["started"], 2)
+        output_path = f"{self.output_dir}/{document['pdf_name']}/{document['pdf_name']}.{self.engine.backend.ext}"
+        # the document's wall time, and the CPU time and peak memory of every task it ran on the pool
+        metrics.record("document", format = self.engine.backend.ext, document = document["pdf_name"], status = "ok" if status == "done" else "error",
+                       seconds = seconds, cpu_seconds = round(document["cpu_seconds"], 4), rss_peak_mb = document["rss_peak_mb"] or None,
+                       pages = sum(document["pages"].values()), chunks = len(document["pages"]), bytes_in = metrics.size_of(document["pdf_path"]),
+                       bytes_out = metrics.size_of(output_path) if status == "done" else 0, **({"error": details["error"]} if "error" in details else {}),
+                       **({"cached": True} if details.get("cached") else {}))
+        self.on_status(document["pdf"], status, seconds = seconds, **details)
+
+    # seconds until the earliest running document times out, None without a timeout
+    def next_deadline(self):
+        if not self.timeout or not self.active:
+            return None
+        return max(0, min(document["started"] for document in self.active) + self.timeout - time.time())
+
+    # abandoning documents past the timeout - their queued tasks are dropped, and the workers running their tasks are
+    # killed, failing those tasks so one hung Spire call can't keep the batch waiting
+    def expire(self):
+        if not self.timeout:
+            return
+        for document in list(self.active):
+            if time.time() - document["started"] > self.timeout:
+                self.finish(document, "failed", error = f"timed out after {self.timeout}s", timed_out = True)
+                for future, (_, task_document, _) in list(self.in_flight.items()):
+                    if task_document is document:
+                        self.pool.kill(future, f"{document['pdf_name']} timed out after {self.timeout}s")
@@ -0,0 +1,116 @@
+"""
+the production server - a Flask app under gunicorn with several worker processes, each warming Spire up with a
+one-page conversion as it boots, so the first real request doesn't pay for loading Spire's native libraries and fonts.
+`GET /ready` answers 503 until a worker's warm-up is done, then reports its cold start and memory.
+
+usage: python -m ilikepdf.serve --format docx --working-dir pdf-docx-api/working --bind 0.0.0.0:5000 --workers 4
+       python -m ilikepdf.serve --format docx,pptx --working-dir pdf-api/working
+       python -m ilikepdf.serve --format pptx --working-dir pdf-pptx-api/working --dev
+"""
+
+import argparse
+import os
+import threading
+import time
+from io import BytesIO
+from . import settings
+from .backends import available_backends
+
+# a one-page PDF with text, a line drawing and an image, generated so warm-up touches fonts, vectors and image codecs
+def sample_pdf():
+    import fitz # PyMuPDF
+    with fitz.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), "Warming up", fontsize = 18)
+        page.insert_textbox(fitz.Rect(72, 100, 520, 300), "Loading fonts, layouts and codecs before the first request. " * 8, fontsize = 10)
+        page.draw_rect(fitz.Rect(72, 320, 520, 420), color = (0, 0, 0), fill = (0.9, 0.9, 0.9))
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+        pixmap.set_rect(pixmap.irect, (40, 120, 200))
+        page.insert_image(fitz.Rect(72, 440, 200, 568), pixmap = pixmap)
+        return doc.tobytes()
+
+# warming one process up - Spire loaded in this process for splitting, merging and watermarks, and in every
+# worker of its pool for converting to each of the app's formats with each converter splits may be routed to - then marking the app ready
+def warm_up(app, started):
+    from . import metrics
+    from .engine import get_pool, run_chunks
+    from .workers import rss_mb
+
+    readiness, engine = app.config["READINESS"], app.config["ENGINE"]
+    warm_up_started = time.perf_counter()
+    try:
+        with metrics.muted():
+            format_engines = list(engine.engines.values())
+            splits, _ = format_engines[0].split_pdf_stream(sample_pdf())
+            for format_engine in format_engines:
+                backend = format_engine.backend
+                # one split per pool worker, submitted together so each worker starts and converts one
+                for converter in backend.converters():
+                    outputs = run_chunks(backend.convert_chunk_stream, {f"Warmup-{i + 1}": (splits[0], converter) for i in range(engine.workers)}, engine.workers)
+                backend.remove_watermarks(BytesIO(backend.merge_stream(list(outputs.values())[:2])), BytesIO())
+    except Exception as e:
+        readiness.update(status = "failed", error = str(e))
+        print(f"Worker {os.getpid()} failed to warm up: {e}")
+        return
+
+    pool = get_pool(engine.workers) if engine.workers > 1 else None
+    readiness.update(status = "ready", cold_start_s = round(time.perf_counter() - started, 2), warm_up_s = round(time.perf_counter() - warm_up_started, 2),
+                     warm_rss_mb = round(rss_mb()), pool_workers = len(pool.running) if pool else 0, pool_peak_rss_mb = pool.stats["peak_rss_mb"] if pool else None)
+    metrics.record("warm_up", format = ",".join(engine.formats), seconds = readiness["cold_start_s"], rss_end_mb = readiness["warm_rss_mb"])
+    print(f"Worker {os.getpid()} ready in {readiness['cold_start_s']}s (warm-up {readiness['warm_up_s']}s), {readiness['warm_rss_mb']} MB, "
+          f"{readiness['pool_workers']} pool workers at up to {readiness['pool_peak_rss_mb'] or 0} MB")
+
+# building the app in the process that serves it, warming it up in the background so /ready can answer meanwhile
+def load_app(output_format, working_dir, chunk_workers, warm = settings.warm_up):
+    started = time.perf_counter()
+    from .api import create_app # Spire is only loaded here, after gunicorn has forked the worker - it isn't fork-safe
+    app = create_app(output_format, working_dir, chunk_workers)
+    if warm:
+        app.config["READINESS"].update(status = "warming")
+        threading.Thread(target = warm_up, args = (app, started), daemon = True).start()
+    return app
+
+def serve(output_format, working_dir, bind = settings.web_bind, workers = settings.web_workers, threads = settings.web_threads,
+          chunk_workers = None, timeout = settings.web_timeout, max_requests = 0):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            # gthread workers, so status polls and downloads are served while conversions run on other threads
+            for key, value in {"bind": bind, "workers": workers, "worker_class": "gthread", "threads": threads, "timeout": timeout,
+                               "max_requests": max_requests, "max_requests_jitter": max_requests // 10, "preload_app": False}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load_app(output_format, working_dir, chunk_workers)
+
+    Server().run()
+
+# command-line entry point - `defaults` pre-fill the arguments, as the scripts in APIs do
+def main(argv = None, **defaults):
+    parser = argparse.ArgumentParser(description = "Serve the PDF to DOCX/PPTX API.")
+    parser.add_argument("--format", dest = "output_format", help = "output format, or several separated by commas (docx,pptx) to serve them from one app")
+    parser.add_argument("--working-dir", help = "directory the API keeps its files in")
+    parser.add_argument("--bind", default = settings.web_bind, help = "address to listen on")
+    parser.add_argument("--workers", type = int, default = settings.web_workers, help = "server processes, each with its own pool of chunk workers")
+    parser.add_argument("--threads", type = int, default = settings.web_threads, help = "requests each server process handles at once")
+    parser.add_argument("--chunk-workers", type = int, help = "processes converting splits for each server process (defaults to an equal share of CONVERT_WORKERS)")
+    parser.add_argument("--timeout", type = int, default = settings.web_timeout, help = "seconds before an unresponsive server process is restarted")
+    parser.add_argument("--max-requests", type = int, default = 0, help = "requests after which a server process is replaced (0 never replaces it)")
+    parser.add_argument("--dev", action = "store_true", help = "run Flask's single-process debug server instead")
+    parser.set_defaults(**defaults)
+    args = parser.parse_args(argv)
+    if not (args.output_format and args.working_dir):
+        parser.error("--format and --working-dir are required")
+    unsupported = [fmt for fmt in args.output_format.split(",") if fmt not in available_backends]
+    if unsupported:
+        parser.error(f"unsupported format: {', '.join(unsupported)} (expected one of {', '.join(available_backends)})")
+
+    if args.dev:
+        load_app(args.output_format, args.working_dir, args.chunk_workers, warm = False).run(debug = True)
+        return
+    chunk_workers = args.chunk_workers or max(1, settings.max_workers // args.workers)
+    serve(args.output_format, args.working_dir, args.bind, args.workers, args.threads, chunk_workers, args.timeout, args.max_requests)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
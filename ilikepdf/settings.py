@@ -0,0 +1,132 @@
+"""
+settings shared by the conversion engine and its front ends.
+every setting can be overridden with the environment variable of the same name in capitals.
+"""
+
+import os
+
+### parallel conversion
+# number of worker processes converting split PDFs in parallel (1 converts them one after another)
+max_workers = int(os.environ.get("CONVERT_WORKERS", os.cpu_count() or 1))
+# Spire leaks native memory, so a worker is replaced after this many splits or once it holds this many MB (0 disables either limit)
+worker_max_tasks = int(os.environ.get("WORKER_MAX_TASKS", 25))
+worker_max_rss_mb = float(os.environ.get("WORKER_MAX_RSS_MB", 1024))
+
+### chunk planning
+# bounds on pages per split - small splits pay Spire's load/save overhead too often, large ones serialise the work
+# the bundled Spire build only saves the first 10 pages of any document it writes, splits and converted files alike,
+# so no split may ever hold more than 10 pages - anything past that would be dropped without an error
+min_chunk_pages = 5
+max_chunk_pages = 10
+# pages per split when set explicitly (e.g. CHUNK_PAGES=5), otherwise the planner decides - capped at max_chunk_pages either way
+chunk_pages = min(int(os.environ.get("CHUNK_PAGES", 0)), max_chunk_pages) or None
+# upper bound on the estimated memory one split may need while Spire converts it, in MB
+chunk_memory_budget_mb = float(os.environ.get("CHUNK_MEMORY_BUDGET_MB", 768))
+# rough conversion memory model: a fixed cost per page, plus content stream size, plus every embedded image
+page_base_mb = 4
+content_mb_per_kb = 0.05
+image_mb = 12
+# spire copies each split's pages out of the whole document loaded into Spire; pymupdf slices the PDF with PyMuPDF,
+# which opens and copies pages without building Spire's object model
+split_backend = os.environ.get("SPLIT_BACKEND", "spire")
+
+### pipeline
+# passing splits between steps as bytes instead of files (IN_MEMORY_PIPELINE=0 goes back to the working directory)
+in_memory_pipeline = os.environ.get("IN_MEMORY_PIPELINE", "1") != "0"
+# converting a PDF that fits in one split straight to its output, with no split files and no merge (FAST_PATH=0 turns it off)
+fast_path = os.environ.get("FAST_PATH", "1") != "0"
+# keeping split_pdfs, split_{format}s and temp-output after a document is converted, for debugging
+keep_intermediates = os.environ.get("KEEP_INTERMEDIATES", "0") == "1"
+
+### merging
+# incremental appends each converted split to the merged file as soon as it and every split before it are converted,
+# so merging overlaps with conversion; tree merges neighbouring splits in parallel, level by level, once all are converted
+merge_strategy = os.environ.get("MERGE_STRATEGY", "incremental")
+# splits merged together at each level of a tree merge (2 merges them pairwise)
+merge_fan_in = int(os.environ.get("MERGE_FAN_IN", 2))
+# spire loads every split into Spire's object model; ooxml copies the splits' parts straight between the zip packages,
+# storing identical media, fonts and slide masters once
+merge_backend = os.environ.get("MERGE_BACKEND", "spire")
+
+### docx conversion
+# which converter turns each split into DOCX - auto sends splits of plain text pages to pdf2docx, which lays plain text
+# out several times faster than Spire, and keeps every other split on Spire; spire or pdf2docx converts every split with one
+docx_converter = os.environ.get("DOCX_CONVERTER", "auto")
+# painted paths a page may have and still count as plain text - tables, charts and boxed layouts paint far more, and
+# pdf2docx's table detection is much slower than Spire on them
+plain_text_max_paint_ops = int(os.environ.get("PLAIN_TEXT_MAX_PAINT_OPS", 10))
+
+### output optimisation
+# shrinking every converted file once its watermarks are removed (OPTIMISE_OUTPUT=1 turns it on) - images downsampled to
+# OPTIMISE_DPI at the size they're shown at (0 keeps their resolution) and re-encoded as the smallest of PNG and, for opaque
+# images, JPEG at OPTIMISE_JPEG_QUALITY (0 keeps them lossless), identical media stored once and the package recompressed
+optimise_output = os.environ.get("OPTIMISE_OUTPUT", "0") == "1"
+optimise_dpi = int(os.environ.get("OPTIMISE_DPI", 150))
+optimise_jpeg_quality = int(os.environ.get("OPTIMISE_JPEG_QUALITY", 80))
+
+### metrics
+# where each stage's JSON metrics line is written - stderr, a file path, or off
+metrics_log = os.environ.get("METRICS_LOG", "stderr")
+
+### caches
+# directory for both caches (defaults to `cache` next to the front end's working directory)
+cache_dir = os.environ.get("CACHE_DIR")
+# total size each cache may reach before the least recently used files are evicted, in MB (0 disables it)
+cache_max_mb = float(os.environ.get("CACHE_MAX_MB", 2048))
+chunk_cache_max_mb = float(os.environ.get("CHUNK_CACHE_MAX_MB", 2048))
+
+### uploads
+# uploads larger than this are refused with 413, on their Content-Length or as soon as the body passes it, in MB (0 disables the limit)
+max_upload_mb = float(os.environ.get("MAX_UPLOAD_MB", 200))
+# PDFs with more pages than this are refused with 422 before any conversion work (0 disables the limit)
+max_upload_pages = int(os.environ.get("MAX_UPLOAD_PAGES", 2000))
+# bytes of a request body read at a time while it's streamed to disk
+upload_chunk_bytes = 1024 * 1024
+
+### workspaces
+# directory each request's workspace is made in - its upload, splits and output (defaults to `jobs` in the front end's working directory)
+workspace_dir = os.environ.get("WORKSPACE_DIR")
+# tmpfs directory workspaces are made in instead while they fit its budget, in MB (WORKSPACE_TMPFS_MB=0 keeps them all on disk)
+workspace_tmpfs_dir = os.environ.get("WORKSPACE_TMPFS_DIR", "/dev/shm")
+workspace_tmpfs_mb = float(os.environ.get("WORKSPACE_TMPFS_MB", 1024))
+# space reserved per byte of upload - the PDF, its splits, the converted splits, the merged and the final file
+workspace_size_factor = 6
+# space the live workspaces may reserve, in MB - new requests are refused with 503 beyond it (0 disables the limit)
+workspace_quota_mb = float(os.environ.get("WORKSPACE_QUOTA_MB", 10240))
+# seconds between janitor sweeps, which drop expired jobs and remove workspaces nobody holds (0 disables the janitor)
+janitor_interval = int(os.environ.get("JANITOR_INTERVAL", 60))
+
+### serving
+# address the production server listens on, its worker processes, and the requests each one handles at once
+web_bind = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+web_workers = int(os.environ.get("WEB_WORKERS", 2))
+web_threads = int(os.environ.get("WEB_THREADS", 4))
+# seconds before gunicorn restarts a server process that stopped responding
+web_timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+# converting a one-page PDF in every server process as it boots, so the first request doesn't pay for loading Spire
+warm_up = os.environ.get("WARM_UP", "1") != "0"
+
+### request scheduling
+# documents converting at once in a server process - every request waits for a slot, interactive requests first, then the
+# client furthest behind its fair share of pages converted, smaller documents first
+convert_slots = int(os.environ.get("CONVERT_SLOTS", 4))
+# conversions one client may have running at once, and waiting at once - beyond that its requests get 429 (0 disables either limit)
+client_max_active = int(os.environ.get("CLIENT_MAX_ACTIVE", 2))
+client_max_queued = int(os.environ.get("CLIENT_MAX_QUEUED", 8))
+# header naming the client a request comes from when it has no X-API-Key (the remote address is used without either)
+client_header = os.environ.get("CLIENT_HEADER", "X-Client-Id")
+# seconds a batch request waits before it's ordered alongside interactive ones, so a steady stream of those can't starve it
+batch_aging_s = float(os.environ.get("BATCH_AGING_S", 120))
+# seconds an interactive request waits for a slot before it gets 503 (0 waits as long as it takes)
+max_queue_wait_s = float(os.environ.get("MAX_QUEUE_WAIT_S", 300))
+
+### background jobs
+# batch conversions (background jobs, unless they ask to be interactive) running at once - the rest of the slots are kept
+# for interactive requests
+job_workers = int(os.environ.get("JOB_WORKERS", 2))
+# jobs waiting or running at once; new jobs are rejected beyond this
+max_queued_jobs = int(os.environ.get("MAX_QUEUED_JOBS", 16))
+# seconds a finished job's result is kept for download
+job_ttl = int(os.environ.get("JOB_TTL", 3600))
+# finished jobs kept for download at once - the oldest are dropped, their results with them, beyond this
+max_finished_jobs = int(os.environ.get("MAX_FINISHED_JOBS", 64))
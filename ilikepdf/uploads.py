@@ -0,0 +1,102 @@
+"""
+receiving uploads - the request body is streamed to a spool file a chunk at a time, never held in memory whole, and
+checked against the size and page limits before any conversion work starts, so oversized or broken uploads cost almost nothing.
+"""
+
+import os
+import tempfile
+import fitz # PyMuPDF
+from flask import Request, g
+from . import settings
+
+class UploadRejected(Exception):
+    """Raised for an upload refused before conversion; `status` is the HTTP status to answer with (400, 413 or 422)."""
+    def __init__(self, message, status):
+        self.status = status
+        super().__init__(message)
+
+class SpooledRequest(Request):
+    """Flask request writing each uploaded file straight to the request's workspace (`g.workspace`) as it's parsed."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename = None, content_length = None):
+        if "workspace" not in g:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        stream = tempfile.NamedTemporaryFile("wb+", dir = g.workspace, prefix = "upload-", suffix = ".pdf", delete = False)
+        self.spooled = getattr(self, "spooled", []) + [stream.name]
+        return stream
+
+# removing every file spooled for `request` except `keep`
+def discard(request, keep = None):
+    for path in getattr(request, "spooled", []):
+        if path != keep and os.path.exists(path):
+            os.remove(path)
+
+# writing a raw request body to a new spool file in `chunk_size` reads, refusing it as soon as it passes `max_bytes`
+def spool(stream, directory, max_bytes = None, chunk_size = settings.upload_chunk_bytes):
+    fd, path = tempfile.mkstemp(dir = directory, prefix = "upload-", suffix = ".pdf")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := stream.read(chunk_size):
+                # a body that doesn't start like a PDF is refused after its first chunk
+                if size == 0 and b"%PDF-" not in chunk[:1024]:
+                    raise UploadRejected("the upload is not a PDF", 422)
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadRejected(f"the upload is larger than {max_bytes / 2**20:g} MB", 413)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+# checking a spooled PDF opens and is within `max_pages` - PyMuPDF only reads the trailer and page tree, not the pages
+# returns the page count
+def probe(path, max_pages = settings.max_upload_pages):
+    with open(path, "rb") as f:
+        if b"%PDF-" not in f.read(1024):
+            raise UploadRejected("the upload is not a PDF", 422)
+    try:
+        with fitz.open(path, filetype = "pdf") as doc:
+            if doc.needs_pass:
+                raise UploadRejected("the PDF is password protected", 422)
+            pages = doc.page_count
+    except UploadRejected:
+        raise
+    except Exception:
+        raise UploadRejected("the PDF can't be read", 422)
+    if not pages:
+        raise UploadRejected("the PDF has no pages", 422)
+    if max_pages and pages > max_pages:
+        raise UploadRejected(f"the PDF has {pages} pages, more than the limit of {max_pages}", 422)
+    return pages
+
+# receiving the PDF of a request into its workspace - a `file` form field, or the raw body sent as application/pdf (named by `?name=`)
+# returns (spooled path, pdf name, page count)
+def receive(request, max_pages = settings.max_upload_pages):
+    max_bytes = request.max_content_length
+    # refused on its Content-Length alone, before a byte of the body is read
+    if max_bytes and request.content_length and request.content_length > max_bytes:
+        raise UploadRejected(f"the upload is larger than {max_bytes / 2**20:g} MB", 413)
+
+    if request.mimetype == "application/pdf":
+        path = spool(request.stream, g.workspace, max_bytes)
+        pdf_name = request.args.get("name", "document").split(".")[0]
+    else:
+        try:
+            file = request.files.get("file")
+        except BaseException:
+            discard(request)
+            raise
+        if file is None:
+            discard(request)
+            raise UploadRejected("no PDF in the `file` field", 400)
+        file.stream.flush()
+        path, pdf_name = file.stream.name, file.filename.split(".")[0]
+        discard(request, keep = path)
+
+    try:
+        return path, pdf_name, probe(path, max_pages)
+    except BaseException:
+        os.remove(path)
+        raise
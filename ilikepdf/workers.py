@@ -0,0 +1,237 @@
+"""
+supervised worker processes - Spire leaks native memory with every document it touches, so instead of letting
+a long-lived worker grow until the OOM killer stops the batch, each worker retires after a number of tasks or
+once its memory passes a limit, and the pool starts a fresh one in its place.
+"""
+
+import os
+import resource
+import sys
+import threading
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from multiprocessing.connection import wait
+from . import settings
+
+class WorkerCrashed(Exception):
+    """Raised for a task whose worker process died while running it - the pool itself carries on."""
+
+class WorkerKilled(Exception):
+    """Raised for a task whose worker process was killed on purpose, e.g. past a timeout."""
+
+# current resident memory of this process in MB
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb() # no /proc (e.g. macOS) - the peak is the best available upper bound
+
+# peak resident memory of this process in MB - since the last reset_peak_rss() where /proc has the high-water mark,
+# otherwise over the process's whole life (ru_maxrss is in KB on Linux and in bytes on macOS)
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 2**10
+    except (OSError, StopIteration):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+# resetting this process's memory high-water mark to its current resident memory (Linux only) - returns whether it was reset
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+# whether this process is a pool worker, running one task at a time
+_in_worker = False
+
+def in_worker():
+    return _in_worker
+
+# the loop each worker process runs - one task at a time, until it's told to stop or reaches one of its limits
+def worker_main(conn, max_tasks, max_rss):
+    global _in_worker
+    _in_worker = True
+    tasks = 0
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        fn, args = task
+        try:
+            outcome = ("ok", fn(*args))
+        except Exception as e:
+            outcome = ("error", e)
+        tasks += 1
+        retire = bool(max_tasks and tasks >= max_tasks) or bool(max_rss and rss_mb() > max_rss)
+        try:
+            conn.send((*outcome, peak_rss_mb(), retire))
+        except Exception as e: # an unpicklable result or exception is sent as its message
+            conn.send(("error", RuntimeError(str(outcome[1]) if outcome[0] == "error" else f"unpicklable result: {e}"), peak_rss_mb(), retire))
+        if retire:
+            break
+    print(f"Worker {os.getpid()} exiting after {tasks} tasks, peak memory {peak_rss_mb():.0f} MB")
+    conn.close()
+
+class Worker:
+    def __init__(self, context, max_tasks, max_rss):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target = worker_main, args = (child_conn, max_tasks, max_rss), daemon = True)
+        self.process.start()
+        child_conn.close()
+        self.future = None # the task it's running
+        self.killed = False
+
+class WorkerPool:
+    """Process pool with the `submit`/`shutdown` interface of ProcessPoolExecutor, recycling workers at `max_tasks` tasks or `max_rss_mb` of memory."""
+
+    def __init__(self, workers = settings.max_workers, max_tasks = settings.worker_max_tasks, max_rss_mb = settings.worker_max_rss_mb):
+        self.workers = workers
+        self.max_tasks = max_tasks
+        self.max_rss_mb = max_rss_mb
+        self.context = mp.get_context("spawn") # Spire's native state isn't fork-safe
+        self.pending = deque() # (future, fn, args) waiting for an idle worker
+        self.running = [] # live Worker processes
+        self.stats = {"tasks": 0, "recycled": 0, "crashed": 0, "killed": 0, "peak_rss_mb": 0}
+        self.lock = threading.Lock()
+        self.closed = False
+        self.wake_r, self.wake_w = mp.Pipe(duplex = False) # wakes the supervisor when tasks are submitted
+        self.supervisor = threading.Thread(target = self.supervise, daemon = True)
+        self.supervisor.start()
+
+    def submit(self, fn, *args):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("cannot submit to a pool that was shut down")
+            self.pending.append((future, fn, args))
+            self.wake_w.send(None)
+        return future
+
+    # stopping the workers once their current tasks are done, optionally cancelling tasks that haven't started
+    def shutdown(self, wait = True, cancel_futures = False):
+        with self.lock:
+            self.closed = True
+            if cancel_futures:
+                while self.pending:
+                    self.pending.popleft()[0].cancel()
+            self.wake_w.send(None)
+        if wait:
+            self.supervisor.join()
+
+    # killing the worker running `future` (or cancelling it, when it hasn't started) and failing it with WorkerKilled,
+    # so a task stuck inside Spire can't hold up the caller - the pool starts a fresh worker in its place
+    # returns False when the task had already finished
+    def kill(self, future, reason = "killed"):
+        with self.lock:
+            if future.cancel():
+                return True
+            worker = next((worker for worker in self.running if worker.future is future), None)
+            if worker is None:
+                return False
+            worker.future, worker.killed = None, True
+            worker.process.kill()
+            self.stats["killed"] += 1
+        try:
+            future.set_exception(WorkerKilled(reason))
+        except InvalidStateError: # its result arrived just before the kill
+            return False
+        return True
+
+    # handing pending tasks to idle workers, starting workers up to the pool size as needed
+    def dispatch(self):
+        with self.lock:
+            while self.pending:
+                idle = [worker for worker in self.running if worker.future is None and not worker.killed]
+                if not idle and len(self.running) >= self.workers:
+                    return
+                future, fn, args = self.pending.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if idle:
+                    worker = idle[0]
+                else:
+                    try:
+                        worker = Worker(self.context, self.max_tasks, self.max_rss_mb)
+                    except Exception as e: # e.g. a pool used while its own module is still being imported by a spawned process
+                        future.set_exception(e)
+                        continue
+                    self.running.append(worker)
+                worker.future = future
+                try:
+                    worker.conn.send((fn, args))
+                except OSError:
+                    pass # the worker died before reading it - its sentinel fails the task
+                except Exception as e: # fn or its arguments can't be pickled
+                    worker.future = None
+                    future.set_exception(e)
+
+    # removing a worker that retired or died, failing the task it was running if it died mid-task
+    # - taken off `running` and its task taken over holding the lock, so a concurrent kill() neither misses a live worker
+    # nor clears the task under it
+    def retire(self, worker, crashed = False):
+        with self.lock:
+            self.running.remove(worker)
+            future, worker.future = worker.future, None
+        if worker.killed:
+            worker.process.join(1)
+        elif crashed:
+            self.stats["crashed"] += 1
+            worker.process.join(1)
+            if future is not None:
+                future.set_exception(WorkerCrashed(f"worker process died with exit code {worker.process.exitcode}"))
+        else:
+            self.stats["recycled"] += 1
+            worker.process.join()
+        worker.conn.close()
+
+    # the supervisor thread - collects results, replaces recycled and crashed workers, keeps every worker busy
+    def supervise(self):
+        while True:
+            self.dispatch()
+            with self.lock:
+                if self.closed and not self.pending and all(worker.future is None for worker in self.running):
+                    break
+            handles = {self.wake_r: None}
+            for worker in self.running:
+                handles[worker.conn] = worker
+                handles[worker.process.sentinel] = worker
+            for ready in wait(list(handles)):
+                if ready is self.wake_r:
+                    while self.wake_r.poll():
+                        self.wake_r.recv()
+                    continue
+                worker = handles[ready]
+                if worker not in self.running:
+                    continue # already handled through its other handle
+                if ready is worker.conn:
+                    try:
+                        status, value, peak, recycle = worker.conn.recv()
+                    except (EOFError, OSError):
+                        self.retire(worker, crashed = True)
+                        continue
+                    with self.lock:
+                        future, worker.future = worker.future, None
+                    if future is None: # killed while its result was on the way
+                        continue
+                    self.stats["tasks"] += 1
+                    self.stats["peak_rss_mb"] = max(self.stats["peak_rss_mb"], round(peak))
+                    future.set_result(value) if status == "ok" else future.set_exception(value)
+                    if recycle:
+                        self.retire(worker)
+                elif not worker.conn.poll(): # exited without a result waiting to be read
+                    self.retire(worker, crashed = worker.future is not None)
+
+        # stopping the idle workers
+        for worker in self.running:
+            if not worker.killed:
+                worker.conn.send(None)
+        for worker in self.running:
+            worker.process.join()
+            worker.conn.close()
+        self.running = []
@@ -0,0 +1,124 @@
+"""
+per-job workspaces - every request gets a directory of its own for its upload, splits and output, on tmpfs when the
+job fits the tmpfs budget, removed once the response is sent, with a janitor thread keeping the disk under a quota.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from . import settings
+
+class WorkspaceFull(Exception):
+    """Raised when a new workspace would take the live workspaces past the disk quota."""
+
+# whether the process `pid` is still running
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass # exists but belongs to someone else
+    return True
+
+# total size of the files under `path`, in bytes
+def tree_size(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass # removed while walking
+    return total
+
+class Workspaces:
+    """Creates and removes job workspaces under `root` (or `tmpfs_root`), and runs the janitor that enforces `quota_mb`."""
+
+    prefix = "job-"
+
+    def __init__(self, root, tmpfs_root = settings.workspace_tmpfs_dir, tmpfs_mb = settings.workspace_tmpfs_mb,
+                 quota_mb = settings.workspace_quota_mb, interval = settings.janitor_interval, on_sweep = None):
+        self.root = root
+        self.tmpfs_root = tmpfs_root if tmpfs_root and tmpfs_mb and os.path.isdir(tmpfs_root) else None
+        self.tmpfs_budget = tmpfs_mb * 2**20
+        self.quota = quota_mb * 2**20
+        self.interval = interval
+        self.on_sweep = on_sweep # called before every sweep, e.g. to drop expired jobs and release their workspaces
+        self.live = {} # path -> bytes reserved for it
+        self.lock = threading.Lock()
+        self.stats = {"created": 0, "tmpfs": 0, "released": 0, "swept": 0, "refused": 0}
+        os.makedirs(root, exist_ok = True)
+        self.janitor = None
+
+    # a new empty workspace for a job expected to need about `size_hint` bytes - on tmpfs when that fits its budget
+    def create(self, size_hint = 0):
+        reserve = int(size_hint * settings.workspace_size_factor)
+        with self.lock:
+            used = sum(self.live.values())
+            if self.quota and used + reserve > self.quota:
+                self.stats["refused"] += 1
+                raise WorkspaceFull(f"workspaces are using {used / 2**20:.0f} of {self.quota / 2**20:.0f} MB, retry later")
+            on_tmpfs = sum(size for path, size in self.live.items() if path.startswith(self.tmpfs_root)) if self.tmpfs_root else None
+            if self.tmpfs_root and on_tmpfs + reserve <= self.tmpfs_budget and reserve < shutil.disk_usage(self.tmpfs_root).free:
+                path = tempfile.mkdtemp(prefix = f"{self.prefix}{os.getpid()}-", dir = self.tmpfs_root)
+                self.stats["tmpfs"] += 1
+            else:
+                path = tempfile.mkdtemp(prefix = f"{self.prefix}{os.getpid()}-", dir = self.root)
+            self.live[path] = reserve
+            self.stats["created"] += 1
+        return path
+
+    # removing a workspace and everything in it
+    def release(self, path):
+        with self.lock:
+            if self.live.pop(path, None) is None:
+                return
+            self.stats["released"] += 1
+        shutil.rmtree(path, ignore_errors = True)
+
+    # starting the janitor thread
+    def start(self):
+        if self.janitor is None and self.interval:
+            self.janitor = threading.Thread(target = self.run_janitor, daemon = True)
+            self.janitor.start()
+        return self
+
+    def run_janitor(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Workspace janitor failed: {e}")
+
+    # removing workspaces nobody holds - left by a process that died, or whose removal failed - then reporting
+    # when the live ones alone are past the quota (new workspaces are refused until they're released)
+    # workspaces are named `job-{pid}-...`, so server processes sharing a root only sweep their own and dead processes' ones
+    def sweep(self):
+        if self.on_sweep:
+            self.on_sweep()
+        for root in filter(None, (self.root, self.tmpfs_root)):
+            for entry in os.scandir(root):
+                owner = entry.name[len(self.prefix):].split("-", 1)[0]
+                if not entry.name.startswith(self.prefix) or not owner.isdigit() or not entry.is_dir():
+                    continue
+                with self.lock:
+                    held = entry.path in self.live
+                if (int(owner) == os.getpid() and not held) or (int(owner) != os.getpid() and not alive(int(owner))):
+                    shutil.rmtree(entry.path, ignore_errors = True)
+                    self.stats["swept"] += 1
+        used = sum(tree_size(path) for path in list(self.live))
+        if self.quota and used > self.quota:
+            print(f"Workspaces hold {used / 2**20:.0f} MB, over the {self.quota / 2**20:.0f} MB quota")
+        return used
+
+    # counters plus what the live workspaces hold
+    def summary(self):
+        with self.lock:
+            live = list(self.live)
+            summary = dict(self.stats)
+        summary["live"], summary["bytes"] = len(live), sum(tree_size(path) for path in live)
+        return summary